@@ -84,8 +84,8 @@ class EvalNode:
 class EvalConstant(EvalNode):
     __slots__ = ('value',)
 
-    def __init__(self, value):
-        super().__init__(type(value))
+    def __init__(self, value, dtype=None):
+        super().__init__(type(value) if dtype is None else dtype)
         self.value = value
 
     def __call__(self, _):
@@ -182,6 +182,8 @@ def binaryop(op, intypes, outtype, nullsafe=False):
 
 
 def Operator(op, operands):
+    if op in LOGICAL_OPERATORS:
+        return LOGICAL_OPERATORS[op](operands)
     op = types.function_lookup(OPERATORS, op, operands)
     if op is not None:
         return op(*operands)
@@ -190,10 +192,8 @@ def Operator(op, operands):
 
 unaryop(query_parser.Not, [types.Any], bool, nullsafe=True)(operator.not_)
 
-@unaryop(query_parser.Neg, [int], int)
-@unaryop(query_parser.Neg, [Decimal], Decimal)
-def neg_(x):
-    return -x
+unaryop(query_parser.Neg, [int], int)(operator.neg)
+unaryop(query_parser.Neg, [Decimal], Decimal)(operator.neg)
 
 
 @unaryop(query_parser.IsNull, [object], bool, nullsafe=True)
@@ -206,19 +206,28 @@ def not_null(x):
     return x is not None
 
 
-@binaryop(query_parser.Mul, [Decimal, Decimal], Decimal)
-@binaryop(query_parser.Mul, [Decimal, int], Decimal)
-@binaryop(query_parser.Mul, [int, Decimal], Decimal)
-@binaryop(query_parser.Mul, [int, int], int)
-def mul_(x, y):
-    return x * y
+# The arithmetic operators are implemented directly by the builtin
+# operator functions, avoiding an extra Python call for each evaluation.
+_arithmetic = [
+    (query_parser.Mul, operator.mul),
+    (query_parser.Div, operator.truediv),
+    (query_parser.Add, operator.add),
+    (query_parser.Sub, operator.sub),
+]
 
+_arithmetic_intypes = [
+    ([int, int], int),
+    ([Decimal, int], Decimal),
+    ([int, Decimal], Decimal),
+    ([Decimal, Decimal], Decimal),
+]
 
-@binaryop(query_parser.Div, [Decimal, Decimal], Decimal)
-@binaryop(query_parser.Div, [Decimal, int], Decimal)
-@binaryop(query_parser.Div, [int, Decimal], Decimal)
-def div_(x, y):
-    return x / y
+for node, op in _arithmetic:
+    for intypes, outtype in _arithmetic_intypes:
+        # Division of integers returns a Decimal, see div_int() below.
+        if node is query_parser.Div and outtype is int:
+            continue
+        binaryop(node, intypes, outtype)(op)
 
 
 @binaryop(query_parser.Div, [int, int], Decimal)
@@ -226,22 +235,6 @@ def div_int(x, y):
     return Decimal(x) / y
 
 
-@binaryop(query_parser.Add, [Decimal, Decimal], Decimal)
-@binaryop(query_parser.Add, [Decimal, int], Decimal)
-@binaryop(query_parser.Add, [int, Decimal], Decimal)
-@binaryop(query_parser.Add, [int, int], int)
-def add_(x, y):
-    return x + y
-
-
-@binaryop(query_parser.Sub, [Decimal, Decimal], Decimal)
-@binaryop(query_parser.Sub, [Decimal, int], Decimal)
-@binaryop(query_parser.Sub, [int, Decimal], Decimal)
-@binaryop(query_parser.Sub, [int, int], int)
-def sub_(x, y):
-    return x - y
-
-
 @binaryop(query_parser.Add, [datetime.date, int], datetime.date)
 def add_date_int(x, y):
     return x + datetime.timedelta(days=y)
@@ -296,14 +289,40 @@ for node, op in _comparisons:
         binaryop(node, intypes, bool)(op)
 
 
-@binaryop(query_parser.And, [types.Any, types.Any], bool, nullsafe=True)
-def and_(x, y):
-    return bool(x) and bool(y)
+class EvalAnd(EvalNode):
+    __slots__ = ('operands',)
+
+    def __init__(self, operands):
+        super().__init__(bool)
+        self.operands = operands
+
+    def __call__(self, context):
+        # All the operands are evaluated, without short-circuiting,
+        # because some column accessors update the row context state:
+        # build the list of values before testing them.
+        values = [operand(context) for operand in self.operands]
+        return all(values)
+
+
+class EvalOr(EvalNode):
+    __slots__ = ('operands',)
+
+    def __init__(self, operands):
+        super().__init__(bool)
+        self.operands = operands
 
+    def __call__(self, context):
+        # See EvalAnd.
+        values = [operand(context) for operand in self.operands]
+        return any(values)
 
-@binaryop(query_parser.Or, [types.Any, types.Any], bool, nullsafe=True)
-def or_(x, y):
-    return bool(x) or bool(y)
+
+# Logical operators are N-ary thus they do not fit the registry
+# above, which dispatches on the exact argument types.
+LOGICAL_OPERATORS = {
+    query_parser.And: EvalAnd,
+    query_parser.Or: EvalOr,
+}
 
 
 class EvalCoalesce(EvalNode):
@@ -459,6 +478,30 @@ class ResultSetEnvironment(CompilationEnvironment):
         return AttributeColumn(name)
 
 
+def _fold_constants(node, operands):
+    """Evaluate an operator node with constant operands at compile time.
+
+    Operators do not depend on the row context, thus when all their
+    operands are constants they evaluate to a constant, which saves a
+    chain of calls for each row.
+
+    Args:
+      node: An operator EvalNode instance.
+      operands: The list of the operands of the node.
+    Returns:
+      An EvalConstant instance with the same dtype as the node if all the
+      operands are constants, the given node otherwise.
+    """
+    if not all(isinstance(operand, EvalConstant) for operand in operands):
+        return node
+    try:
+        value = node(None)
+    except Exception:  # pylint: disable=broad-except
+        # Leave errors to be reported at evaluation.
+        return node
+    return EvalConstant(value, node.dtype)
+
+
 def compile_expression(expr, environ):
     """Bind an expression to its execution context.
 
@@ -488,10 +531,14 @@ def compile_expression(expr, environ):
         operand = compile_expression(expr.operand, environ)
         op = types.function_lookup(OPERATORS, type(expr), [operand])
         if op is not None:
-            return op(operand)
+            return _fold_constants(op(operand), [operand])
         raise CompilationError(
             f'Operator {type(expr).__name__.lower()}({operand.dtype.__name__}) not supported')
 
+    if isinstance(expr, query_parser.LogicalOp):
+        operands = [compile_expression(operand, environ) for operand in expr.operands]
+        return _fold_constants(LOGICAL_OPERATORS[type(expr)](operands), operands)
+
     if isinstance(expr, query_parser.BinaryOp):
         left = compile_expression(expr.left, environ)
         right = compile_expression(expr.right, environ)
@@ -501,7 +548,7 @@ def compile_expression(expr, environ):
             intypes = [left.dtype, right.dtype]
             for op in candidates:
                 if op.__intypes__ == intypes:
-                    return op(left, right)
+                    return _fold_constants(op(left, right), [left, right])
 
             # Implement type inference when one of the operands is not strongly typed.
             if left.dtype is object and right.dtype is not object:
@@ -1074,7 +1121,7 @@ def transform_journal(journal):
     Returns:
       An instance of an uncompiled Select object.
     """
-    cooked_select = query_parser.Parser().parse("""
+    cooked_select = query_parser.Parser.get().parse("""
 
         SELECT
            date,
@@ -1111,7 +1158,7 @@ def transform_balances(balances):
     ## the first or last sort-order value gets used, because it would simplify
     ## the input statement.
 
-    cooked_select = query_parser.Parser().parse("""
+    cooked_select = query_parser.Parser.get().parse("""
 
       SELECT account, SUM({}(position))
       GROUP BY account, ACCOUNT_SORTKEY(account)
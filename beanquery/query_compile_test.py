@@ -200,6 +200,19 @@ class TestCompileDataTypes(unittest.TestCase):
         c_or = qc.Operator(qp.Or, [qc.EvalConstant(17), qc.EvalConstant(18)])
         self.assertEqual(bool, c_or.dtype)
 
+    def test_compile_And_nary(self):
+        c_and = qc.compile_expression(
+            qp.And([qp.Constant(True), qp.Constant(1), qp.Constant(None)]),
+            qe.TargetsEnvironment())
+        self.assertEqual(bool, c_and.dtype)
+        self.assertIs(c_and(None), False)
+
+        c_or = qc.compile_expression(
+            qp.Or([qp.Constant(False), qp.Constant(None), qp.Constant('a')]),
+            qe.TargetsEnvironment())
+        self.assertEqual(bool, c_or.dtype)
+        self.assertIs(c_or(None), True)
+
     def test_compile_Mul(self):
         c_plus = qc.Operator(qp.Mul, [qc.EvalConstant(17), qc.EvalConstant(18)])
         self.assertEqual(int, c_plus.dtype)
@@ -237,7 +250,7 @@ class CompileSelectBase(unittest.TestCase):
     xcontext_postings = qe.FilterPostingsEnvironment()
 
     def setUp(self):
-        self.parser = qp.Parser()
+        self.parser = qp.Parser.get()
 
     def parse(self, query):
         return self.parser.parse(query.strip())
@@ -342,12 +355,12 @@ class CompileSelectBase(unittest.TestCase):
 class TestCompileFundamentals(CompileSelectBase):
 
     def test_operaotors(self):
-        expr = self.compile("SELECT 1 + 1 AS expr")
+        expr = self.compile("SELECT 1 + number AS expr")
         self.assertEqual(expr, qc.EvalQuery([
             qc.EvalTarget(
                 qc.Operator(qp.Add, [
                     qc.EvalConstant(1),
-                    qc.EvalConstant(1)
+                    qe.Column('number'),
                 ]), 'expr', False)
         ], None, None, None, None, None, None, None))
 
@@ -364,6 +377,25 @@ class TestCompileFundamentals(CompileSelectBase):
                 ]), 'expr', False)
         ], None, None, None, None, None, None, None))
 
+    def test_operators_constants(self):
+        # Operations on constants are folded by the compiler,
+        # preserving the operator output type.
+        tests = [
+            ("SELECT 1 + 1 AS expr", qc.EvalConstant(2)),
+            ("SELECT 'abc' ~ 'b' AS expr", qc.EvalConstant(True)),
+            ("SELECT 2 > 1 AS expr", qc.EvalConstant(True)),
+            ("SELECT 1 = 1 AND 2 = 2 AS expr", qc.EvalConstant(True)),
+        ]
+        for query, constant in tests:
+            with self.subTest(query=query):
+                expr = self.compile(query)
+                self.assertEqual(expr.c_targets[0].c_expr, constant)
+                self.assertEqual(expr.c_targets[0].c_expr.dtype, constant.dtype)
+
+        # Errors are left to be reported at evaluation.
+        expr = self.compile("SELECT 2 / 0 AS expr")
+        self.assertNotIsInstance(expr.c_targets[0].c_expr, qc.EvalConstant)
+
     def test_coalesce(self):
         expr = self.compile("SELECT coalesce(narration, str(date), '~') AS expr")
         self.assertEqual(expr, qc.EvalQuery([
@@ -427,6 +459,12 @@ class TestCompileSelect(CompileSelectBase):
              qc.EvalTarget(qe.Column('date'), 'date', False)],
             query.c_targets)
 
+        # Names are derived from the expressions before folding constants.
+        query = self.compile("SELECT 1 + 1, TRUE AND FALSE, 2 * 3 * number;")
+        self.assertEqual(
+            ['add(1, 1)', 'and(True, False)', 'mul(mul(2, 3), number)'],
+            [target.name for target in query.c_targets])
+
     def test_compile_mixed_aggregates(self):
         # Check mixed aggregates and non-aggregates in a target.
         with self.assertRaises(qc.CompilationError) as assertion:
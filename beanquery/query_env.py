@@ -14,7 +14,6 @@ import decimal
 import re
 import textwrap
 
-from functools import lru_cache as cache
 from decimal import Decimal
 
 from beancount.core.number import ZERO
@@ -39,20 +38,61 @@ from beanquery import types
 FUNCTIONS = collections.defaultdict(list)
 
 
+def _function_call(func, nargs, pass_context):
+    """Build the evaluation method for a function node.
+
+    The functions of one and two arguments, the vast majority, get an
+    evaluation method specialized for their number of arguments, which
+    avoids building and scanning an arguments list for every row.
+
+    Args:
+      func: The function implementing the BQL function.
+      nargs: The number of arguments of the function.
+      pass_context: Whether the function takes the row context as first argument.
+    Returns:
+      A function suitable as the __call__ method of an EvalFunction subclass.
+    """
+    if nargs == 1 and not pass_context:
+        def __call__(self, context):
+            arg = self.operands[0](context)
+            if arg is None:
+                return None
+            return func(arg)
+    elif nargs == 1:
+        def __call__(self, context):
+            arg = self.operands[0](context)
+            if arg is None:
+                return None
+            return func(context, arg)
+    elif nargs == 2 and not pass_context:
+        def __call__(self, context):
+            # Both operands are evaluated, as some column accessors
+            # update the row context state.
+            operands = self.operands
+            arg1 = operands[0](context)
+            arg2 = operands[1](context)
+            if arg1 is None or arg2 is None:
+                return None
+            return func(arg1, arg2)
+    else:
+        def __call__(self, context):
+            args = [operand(context) for operand in self.operands]
+            for arg in args:
+                if arg is None:
+                    return None
+            if pass_context:
+                return func(context, *args)
+            return func(*args)
+    return __call__
+
+
 def function(intypes, outtype, pass_context=False, name=None):
     def decorator(func):
         class Func(query_compile.EvalFunction):
             __intypes__ = intypes
             def __init__(self, operands):
                 super().__init__(operands, outtype)
-            def __call__(self, context):
-                args = [operand(context) for operand in self.operands]
-                for arg in args:
-                    if arg is None:
-                        return None
-                if pass_context:
-                    return func(context, *args)
-                return func(*args)
+            __call__ = _function_call(func, len(intypes), pass_context)
         Func.__name__ = name if name is not None else func.__name__
         Func.__doc__ = func.__doc__
         FUNCTIONS[Func.__name__].append(Func)
@@ -323,35 +363,31 @@ def close_date(context, acc):
 @function([str], object, pass_context=True)
 def meta(context, key):
     """Get some metadata key of the Posting."""
-    try:
-        return context.posting.meta[key]
-    except (AttributeError, KeyError):
-        pass
-    return None
+    posting = context.posting
+    if posting is None or posting.meta is None:
+        return None
+    return posting.meta.get(key)
 
 
 @function([str], object, pass_context=True)
 def entry_meta(context, key):
     """Get some metadata key of the parent directive (Transaction)."""
-    try:
-        return context.entry.meta[key]
-    except (AttributeError, KeyError):
-        pass
-    return None
+    entry = context.entry
+    if entry is None or entry.meta is None:
+        return None
+    return entry.meta.get(key)
 
 
 @function([str], object, pass_context=True)
 def any_meta(context, key):
     """Get metadata from the posting or its parent transaction's metadata if not present."""
-    try:
-        return context.posting.meta[key]
-    except (AttributeError, KeyError):
-        pass
-    try:
-        return context.entry.meta[key]
-    except (AttributeError, KeyError):
-        pass
-    return None
+    posting = context.posting
+    if posting is not None and posting.meta is not None and key in posting.meta:
+        return posting.meta[key]
+    entry = context.entry
+    if entry is None or entry.meta is None:
+        return None
+    return entry.meta.get(key)
 
 
 @function([str], dict, pass_context=True)
@@ -846,7 +882,10 @@ def location(context):
     errors, Emacs is able to pick those up and you can navigate between an
     arbitrary list of transactions with next-error and previous-error.
     """
-    meta = context.posting.meta
+    posting = context.posting
+    if posting is None or posting.meta is None:
+        return None
+    meta = posting.meta
     return '{:s}:{:d}:'.format(meta['filename'], meta['lineno'])
 
 
@@ -970,15 +1009,16 @@ def weight(context):
 
 
 @column(inventory.Inventory)
-@cache(maxsize=1)
 def balance(context):
     """The balance for the posting. These can be summed into inventories."""
-    # Caching protects against multiple balance updates per row when
-    # the columns appears more than once in the execurted query. The
-    # rowid in the row context guarantees that otherwise identical
-    # rows do not hit the cache and thus that the balance is correctly
-    # updated.
-    context.balance.add_position(context.posting)
+    # Tracking the rowid of the last update in the row context protects
+    # against multiple balance updates per row when the column appears
+    # more than once in the executed query. Keeping this state in the
+    # row context, instead than in a global cache, allows concurrent
+    # queries to be executed independently.
+    if context.balance_update_rowid != context.rowid:
+        context.balance.add_position(context.posting)
+        context.balance_update_rowid = context.rowid
     return copy.copy(context.balance)
 
 
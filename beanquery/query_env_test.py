@@ -10,6 +10,7 @@ from beancount.parser import parser
 from beanquery import query_compile as qc
 from beanquery import query_env as qe
 from beanquery import query
+from beanquery import query_execute as qx
 
 
 class TestCompileDataTypes(unittest.TestCase):
@@ -37,6 +38,38 @@ class TestCompileDataTypes(unittest.TestCase):
         self.assertEqual(float, c_last.dtype)
 
 
+class TestFunctionCall(unittest.TestCase):
+
+    def test_null_operands(self):
+        tests = [
+            ('length', ['abc'], 3),
+            ('root', ['Assets:Bank:Checking', 2], 'Assets:Bank'),
+            ('substr', ['abcdef', 1, 3], 'bc'),
+        ]
+        for name, args, result in tests:
+            with self.subTest(function=name):
+                c_func = qe.Function(name, [qc.EvalConstant(arg) for arg in args])
+                self.assertEqual(c_func(None), result)
+                # Functions evaluate to NULL when any argument is NULL.
+                for index in range(len(args)):
+                    operands = [qc.EvalConstant(arg) for arg in args]
+                    operands[index] = qc.EvalConstant(None)
+                    c_func.operands = operands
+                    self.assertIsNone(c_func(None))
+
+
+class TestMissingContext(unittest.TestCase):
+
+    def test_no_posting_or_entry(self):
+        context = qx.RowContext()
+        for name in 'meta', 'entry_meta', 'any_meta':
+            with self.subTest(function=name):
+                c_func = qe.Function(name, [qc.EvalConstant('key')])
+                self.assertIsNone(c_func(context))
+        c_location = qe.TargetsEnvironment().get_column('location')
+        self.assertIsNone(c_location(context))
+
+
 class TestEnv(unittest.TestCase):
 
     @parser.parse_doc()
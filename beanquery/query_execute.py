@@ -6,6 +6,7 @@ __license__ = "GNU GPLv2"
 import copy
 import collections
 import datetime
+import heapq
 import itertools
 import operator
 
@@ -134,6 +135,9 @@ class RowContext:
     # The current running balance *after* applying the posting.
     balance = None
 
+    # The rowid of the last posting applied to the running balance.
+    balance_update_rowid = None
+
     # The parser's options_map.
     options_map = None
 
@@ -152,12 +156,6 @@ class RowContext:
     # A storage area for computing aggregate expression.
     store = None
 
-    # The context hash is used in caching column accessor functions.
-    # Instead than hashing the row context content, use the rowid as
-    # hash.
-    def __hash__(self):
-        return self.rowid
-
 
 class NullType:
     """An object that compares smaller than anything.
@@ -260,13 +258,16 @@ def execute_query(query, entries, options):
         dtypes = ([columns[col1].dtype] + [col.dtype for col in other(columns)] * len(keys))
         columns = [Column(name, dtype) for name, dtype in zip(names, dtypes)]
 
+        # Map the pivot column values to their offset in the output rows.
+        offsets = {key: index * nother + 1 for index, key in enumerate(keys)}
+
         # Populate the pivoted table.
         pivoted = []
         rows.sort(key=operator.itemgetter(col1))
         for field1, group in itertools.groupby(rows, key=operator.itemgetter(col1)):
             outrow = [field1] + [None] * (len(columns) - 1)
             for row in group:
-                index = keys.index(row[col2]) * nother + 1
+                index = offsets[row[col2]]
                 outrow[index:index+nother] = other(row)
             pivoted.append(tuple(outrow))
 
@@ -332,8 +333,9 @@ def execute_select(query, entries, options_map):
                 context.rowid += 1
                 context.posting = posting
                 if c_where is None or c_where(context):
-                    values = [c_expr(context) for c_expr in c_target_exprs]
-                    rows.append(values)
+                    # Building a list is faster than passing a generator to tuple().
+                    rows.append(tuple([c_expr(context)  # pylint: disable=consider-using-generator
+                                       for c_expr in c_target_exprs]))
     else:
         # This is an aggregated query.
 
@@ -356,6 +358,10 @@ def execute_select(query, entries, options_map):
         for c_expr in c_aggregate_exprs:
             c_expr.allocate(allocator)
 
+        # Bind the update methods once, they are the inner loop of the
+        # aggregation and are invoked for every row of every group.
+        c_aggregate_updates = [c_expr.update for c_expr in c_aggregate_exprs]
+
         # Iterate over all the postings to evaluate the aggregates.
         agg_store = {}
         for entry in misc_utils.filter_type(filt_entries, data.Transaction):
@@ -363,24 +369,33 @@ def execute_select(query, entries, options_map):
             for posting in entry.postings:
                 context.rowid += 1
                 context.posting = posting
-                if c_where is None or c_where(context):
+                if c_where is not None and not c_where(context):
+                    continue
 
-                    # Compute the non-aggregate expressions.
-                    row_key = tuple(c_expr(context) for c_expr in c_nonaggregate_exprs)
+                # Compute the non-aggregate expressions. Building a list is
+                # faster than passing a generator to tuple().
+                row_key = tuple([c_expr(context)  # pylint: disable=consider-using-generator
+                                 for c_expr in c_nonaggregate_exprs])
+
+                # Get an appropriate store for the unique key of this row.
+                # A single probe is done for existing groups, without the
+                # cost of raising an exception for each new group.
+                store = agg_store.get(row_key)
+                if store is None:
+                    # This is a row; create a new store.
+                    store = allocator.create_store()
+                    for c_expr in c_aggregate_exprs:
+                        c_expr.initialize(store)
+                    agg_store[row_key] = store
 
-                    # Get an appropriate store for the unique key of this row.
-                    try:
-                        store = agg_store[row_key]
-                    except KeyError:
-                        # This is a row; create a new store.
-                        store = allocator.create_store()
-                        for c_expr in c_aggregate_exprs:
-                            c_expr.initialize(store)
-                        agg_store[row_key] = store
+                # Update the aggregate expressions.
+                for update in c_aggregate_updates:
+                    update(store, context)
 
-                    # Update the aggregate expressions.
-                    for c_expr in c_aggregate_exprs:
-                        c_expr.update(store, context)
+        # Resolve once whether each target is taken from the group key or
+        # is evaluated from the aggregate store.
+        c_group_targets = [(index in group_indexes, c_expr)
+                           for index, c_expr in enumerate(c_target_exprs)]
 
         # Iterate over all the aggregations.
         for key, store in agg_store.items():
@@ -392,8 +407,8 @@ def execute_select(query, entries, options_map):
                 c_expr.finalize(store)
             context.store = store
 
-            for index, c_expr in enumerate(c_target_exprs):
-                if index in group_indexes:
+            for is_key, c_expr in c_group_targets:
+                if is_key:
                     value = next(key_iter)
                 else:
                     value = c_expr(context)
@@ -404,10 +419,23 @@ def execute_select(query, entries, options_map):
                 if not values[query.having_index]:
                     continue
 
-            rows.append(values)
+            rows.append(tuple(values))
 
     # Order results if requested.
-    if order_spec is not None:
+    if order_spec is not None and query.limit is not None and not query.distinct and (
+            len(set(reverse for _, reverse in order_spec)) == 1):
+        # When only the first rows are requested and all the order-by
+        # clauses have the same direction, select the rows to return
+        # without sorting the whole results set: the selection is stable,
+        # as the sort below. This is not possible when DISTINCT is
+        # applied, as the limit is applied after removing duplicates.
+        _, reverse = order_spec[0]
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        # The rows may contain None values: nullitemgetter() replaces
+        # these with a special value that compares smaller than anything
+        # else.
+        rows = select(query.limit, rows, key=nullitemgetter(*[index for index, _ in order_spec]))
+    elif order_spec is not None:
         # Process the order-by clauses grouped by their ordering direction.
         for reverse, spec in itertools.groupby(reversed(order_spec), key=operator.itemgetter(1)):
             indexes = reversed([i[0] for i in spec])
@@ -416,12 +444,15 @@ def execute_select(query, entries, options_map):
             # smaller than anything else.
             rows.sort(key=nullitemgetter(*indexes), reverse=reverse)
 
-    # Convert results into list of tuples.
-    rows = [tuple(row[i] for i in result_indexes) for row in rows]
+    # Drop the invisible columns, if any, from the result rows.
+    if len(result_indexes) != len(c_target_exprs):
+        # Building a list is faster than passing a generator to tuple().
+        rows = [tuple([row[i] for i in result_indexes]) for row in rows]  # pylint: disable=consider-using-generator
 
-    # Apply distinct.
+    # Apply distinct. The dict keys preserve the order of the first
+    # occurrence of each row, hashing each row only once.
     if query.distinct:
-        rows = list(misc_utils.uniquify(rows))
+        rows = list(dict.fromkeys(rows))
 
     # Apply limit.
     if query.limit is not None:
@@ -3,15 +3,16 @@ __license__ = "GNU GPLv2"
 
 import datetime
 import decimal
+import functools
 import io
 import unittest
 import textwrap
+import types
 
 from decimal import Decimal
 
 from beancount.core.number import D
 from beancount.core import inventory
-from beancount.core.inventory import from_string as I
 from beancount.parser import cmptest
 from beancount.utils import misc_utils
 from beancount import loader
@@ -25,6 +26,58 @@ from beanquery import query_execute as qx
 from beanquery import compat
 
 
+@functools.lru_cache(maxsize=64)
+def _load_cached(text, dedent=False):
+    """Load a Beancount input string, memoizing the result.
+
+    Many tests load the very same input. The returned entries and
+    options are shared between callers and must not be mutated: the
+    options are returned as a read-only mapping to enforce this.
+    """
+    entries, errors, options_map = loader.load_string(text, dedent=dedent)
+    return entries, errors, types.MappingProxyType(options_map)
+
+
+# Build the inventories and numbers used in expected rows, memoizing the
+# result. They are shared between tests and must not be mutated.
+_I = functools.lru_cache(maxsize=None)(inventory.from_string)
+_D = functools.lru_cache(maxsize=None)(D)
+
+
+def _fingerprint(bql_string):
+    """Normalize a query to its sequence of tokens.
+
+    Queries differing only by whitespace, comments or the case of the
+    keywords produce the same fingerprint and share a compiled plan. The
+    token values are compared by their string form so that literals which
+    compare equal but differ in representation, like 1.0 and 1.00, are
+    kept distinct.
+    """
+    return tuple((token.type, str(token.value)) for token in qp.Parser.get().tokenize(bql_string))
+
+
+# Compiled queries, keyed by query fingerprint and compilation environments.
+_COMPILED = {}
+
+
+def _compile_cached(bql_string, targets_environ, postings_environ, entries_environ):
+    """Parse and compile a query, memoizing the result.
+
+    The compilation environments are shared class attributes and hash
+    by identity, thus they can be used directly as part of the key.
+    """
+    key = (_fingerprint(bql_string), targets_environ, postings_environ, entries_environ)
+    try:
+        return _COMPILED[key]
+    except KeyError:
+        query = qc.compile_select(qp.Parser.get().parse(bql_string),
+                                  targets_environ,
+                                  postings_environ,
+                                  entries_environ)
+        _COMPILED[key] = query
+        return query
+
+
 class QueryBase(cmptest.TestCase):
 
     maxDiff = 8192
@@ -34,9 +87,15 @@ class QueryBase(cmptest.TestCase):
     xcontext_targets = qe.TargetsEnvironment()
     xcontext_postings = qe.FilterPostingsEnvironment()
 
-    def setUp(self):
-        super().setUp()
-        self.parser = qp.Parser()
+    parser = qp.Parser.get()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Dedent the input ledgers once, when the test class is defined.
+        for name in 'data', 'INPUT':
+            value = cls.__dict__.get(name)
+            if isinstance(value, str):
+                setattr(cls, name, textwrap.dedent(value))
 
     def parse(self, bql_string):
         """Parse a query.
@@ -52,14 +111,20 @@ class QueryBase(cmptest.TestCase):
         """Parse a query and compile it.
 
         Args:
-          bql_string: An SQL query to be parsed.
+          bql_string: An SQL query to be parsed, or an already parsed
+            statement, which is compiled without going through the parser.
         Returns:
           A compiled EvalQuery node.
         """
-        return qc.compile_select(self.parse(bql_string),
-                                 self.xcontext_targets,
-                                 self.xcontext_postings,
-                                 self.xcontext_entries)
+        if not isinstance(bql_string, str):
+            return qc.compile(bql_string,
+                              self.xcontext_targets,
+                              self.xcontext_postings,
+                              self.xcontext_entries)
+        return _compile_cached(bql_string.strip(),
+                               self.xcontext_targets,
+                               self.xcontext_postings,
+                               self.xcontext_entries)
 
     def check_query(self,
                     input_string, bql_string,
@@ -67,7 +132,7 @@ class QueryBase(cmptest.TestCase):
                     sort_rows=False,
                     debug=False):
 
-        entries, _, options_map = loader.load_string(input_string)
+        entries, _, options_map = _load_cached(input_string)
         query = self.compile(bql_string)
         result_types, result_rows = qx.execute_query(query, entries, options_map)
 
@@ -122,17 +187,26 @@ class CommonInputBase(unittest.TestCase):
       Expenses:Restaurant       -104.00 USD
 
     """)
-    def setUp(self):
-        super().setUp()
-        self.entries, _, self.options_map = loader.load_string(textwrap.dedent(self.INPUT))
-        self.context = qx.create_row_context(self.entries, self.options_map)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.entries, _, cls.options_map = _load_cached(cls.INPUT)
+        cls.context = qx.create_row_context(cls.entries, cls.options_map)
+
+
+# Dates used in the TestFundamentals expected results.
+_DATE_2022_03_31 = datetime.date(2022, 3, 31)
+_DATE_2022_04_02 = datetime.date(2022, 4, 2)
+_DATE_2022_04_05 = datetime.date(2022, 4, 5)
 
 
 class TestFundamentals(QueryBase):
 
-    def setUp(self):
-        super().setUp()
-        self.entries, errors, self.options = loader.load_string("""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.entries, errors, cls.options = _load_cached("""
           2022-04-05 commodity TEST
             rate: 42
           2022-04-05 open Assets:Tests
@@ -148,10 +222,31 @@ class TestFundamentals(QueryBase):
               null: NULL
         """, dedent=True)
 
+    def setUp(self):
+        super().setUp()
+        self.results = []
+
     def assertResult(self, query, result, dtype=None):
-        dtypes, rows = qx.execute_query(self.compile(query), self.entries, self.options)
-        self.assertEqual([dtype for name, dtype in dtypes], [dtype or type(result)])
-        self.assertEqual(rows, [(result, )])
+        # The check is deferred to flushResults(), called at the end of
+        # each test, where all the queued expressions are evaluated by a
+        # single query.
+        self.assertTrue(query.startswith('SELECT '))
+        self.results.append((query[len('SELECT '):], result, dtype or type(result)))
+
+    def flushResults(self):
+        """Check all the queued results by executing a single query."""
+        results, self.results = self.results, []
+        if not results:
+            return
+        targets = ', '.join(f'{expr} AS c{i}' for i, (expr, _, _) in enumerate(results))
+        dtypes, rows = qx.execute_query(self.compile(f'SELECT {targets}'), self.entries, self.options)
+        self.assertEqual(len(dtypes), len(results))
+        self.assertEqual(len(rows), 1)
+        # Report mismatches for each expression individually.
+        for (expr, result, dtype), column, value in zip(results, dtypes, rows[0]):
+            with self.subTest(expr=expr):
+                self.assertEqual(column.dtype, dtype)
+                self.assertEqual(value, result)
 
     def assertError(self, query):
         with self.assertRaises(qc.CompilationError):
@@ -192,19 +287,19 @@ class TestFundamentals(QueryBase):
         self.assertResult("SELECT int(meta('missing'))", None, int)
 
         # decimal
-        self.assertResult("SELECT decimal(TRUE)", Decimal(1))
-        self.assertResult("SELECT decimal(1)", Decimal(1))
-        self.assertResult("SELECT decimal(1.2)", Decimal('1.2'))
-        self.assertResult("SELECT decimal('1.2')", Decimal('1.2'))
+        self.assertResult("SELECT decimal(TRUE)", _D('1'))
+        self.assertResult("SELECT decimal(1)", _D('1'))
+        self.assertResult("SELECT decimal(1.2)", _D('1.2'))
+        self.assertResult("SELECT decimal('1.2')", _D('1.2'))
         self.assertResult("SELECT decimal('foo')", None, Decimal)
         self.assertError ("SELECT decimal(NULL)")
         self.assertError ("SELECT decimal(2022-04-05)")
-        self.assertResult("SELECT decimal(meta('int'))", Decimal(1))
-        self.assertResult("SELECT decimal(meta('decimal'))", Decimal('1.2'))
-        self.assertResult("SELECT decimal(meta('bool'))", Decimal(1))
+        self.assertResult("SELECT decimal(meta('int'))", _D('1'))
+        self.assertResult("SELECT decimal(meta('decimal'))", _D('1.2'))
+        self.assertResult("SELECT decimal(meta('bool'))", _D('1'))
         self.assertResult("SELECT decimal(meta('str'))", None, Decimal)
-        self.assertResult("SELECT decimal(meta('str3'))", Decimal(3))
-        self.assertResult("SELECT decimal(meta('str4'))", Decimal('4.0'))
+        self.assertResult("SELECT decimal(meta('str3'))", _D('3'))
+        self.assertResult("SELECT decimal(meta('str4'))", _D('4.0'))
         self.assertResult("SELECT decimal(meta('date'))", None, Decimal)
         self.assertResult("SELECT decimal(meta('null'))", None, Decimal)
         self.assertResult("SELECT decimal(meta('missing'))", None, Decimal)
@@ -230,46 +325,48 @@ class TestFundamentals(QueryBase):
         self.assertError ("SELECT date(1.2)")
         self.assertResult("SELECT date('1.2')", None, datetime.date)
         self.assertResult("SELECT date('foo')", None, datetime.date)
-        self.assertResult("SELECT date('2022-04-05')", datetime.date(2022, 4, 5))
+        self.assertResult("SELECT date('2022-04-05')", _DATE_2022_04_05)
         self.assertError ("SELECT date(NULL)")
-        self.assertResult("SELECT date(2022-04-05)", datetime.date(2022, 4, 5))
-        self.assertResult("SELECT date(2022, 4, 5)", datetime.date(2022, 4, 5))
+        self.assertResult("SELECT date(2022-04-05)", _DATE_2022_04_05)
+        self.assertResult("SELECT date(2022, 4, 5)", _DATE_2022_04_05)
         self.assertResult("SELECT date(meta('int'))", None, datetime.date)
         self.assertResult("SELECT date(meta('decimal'))", None, datetime.date)
         self.assertResult("SELECT date(meta('bool'))", None, datetime.date)
         self.assertResult("SELECT date(meta('str'))", None, datetime.date)
-        self.assertResult("SELECT date(meta('date'))", datetime.date(2022, 4, 5))
+        self.assertResult("SELECT date(meta('date'))", _DATE_2022_04_05)
         self.assertResult("SELECT date(meta('null'))", None, datetime.date)
         self.assertResult("SELECT date(meta('missing'))", None, datetime.date)
 
+        self.flushResults()
+
     def test_operators(self):
         # add
         self.assertResult("SELECT 1 + 1", 2)
-        self.assertResult("SELECT 1.0 + 1", Decimal(2))
-        self.assertResult("SELECT 1.0 + 2.00", Decimal(3))
+        self.assertResult("SELECT 1.0 + 1", _D('2'))
+        self.assertResult("SELECT 1.0 + 2.00", _D('3'))
         self.assertError ("SELECT 1970-01-01 + 2022-04-01")
-        self.assertResult("SELECT 2022-04-01 + 1", datetime.date(2022, 4, 2))
-        self.assertResult("SELECT 1 + 2022-04-01", datetime.date(2022, 4, 2))
+        self.assertResult("SELECT 2022-04-01 + 1", _DATE_2022_04_02)
+        self.assertResult("SELECT 1 + 2022-04-01", _DATE_2022_04_02)
 
         # sub
         self.assertResult("SELECT 1 - 1", 0)
-        self.assertResult("SELECT 1.0 - 1", Decimal(0))
-        self.assertResult("SELECT 1.0 - 2.00", Decimal(-1))
-        self.assertResult("SELECT 2022-04-01 - 1", datetime.date(2022, 3, 31))
+        self.assertResult("SELECT 1.0 - 1", _D('0'))
+        self.assertResult("SELECT 1.0 - 2.00", _D('-1'))
+        self.assertResult("SELECT 2022-04-01 - 1", _DATE_2022_03_31)
         self.assertResult("SELECT 2022-04-01 - 2022-03-31", 1)
         self.assertError ("SELECT 1 - 2022-04-01")
 
         # mul
         self.assertResult("SELECT 2 * 2", 4)
-        self.assertResult("SELECT 2.0 * 2", Decimal(4))
-        self.assertResult("SELECT 2 * 2.0", Decimal(4))
-        self.assertResult("SELECT 2.0 * 2.0", Decimal(4))
+        self.assertResult("SELECT 2.0 * 2", _D('4'))
+        self.assertResult("SELECT 2 * 2.0", _D('4'))
+        self.assertResult("SELECT 2.0 * 2.0", _D('4'))
 
         # div
-        self.assertResult("SELECT 4 / 2", Decimal(2))
-        self.assertResult("SELECT 4.0 / 2", Decimal(2))
-        self.assertResult("SELECT 4 / 2.0", Decimal(2))
-        self.assertResult("SELECT 4.0 / 2.0", Decimal(2))
+        self.assertResult("SELECT 4 / 2", _D('2'))
+        self.assertResult("SELECT 4.0 / 2", _D('2'))
+        self.assertResult("SELECT 4 / 2.0", _D('2'))
+        self.assertResult("SELECT 4.0 / 2.0", _D('2'))
 
         # match
         self.assertResult("SELECT 'foobarbaz' ~ 'bar'", True)
@@ -304,29 +401,144 @@ class TestFundamentals(QueryBase):
         self.assertResult("SELECT 3 IN (2, 3, 4)", True)
         self.assertResult("SELECT 'x' IN ('a', 'b', 'c')", False)
 
+        self.flushResults()
+
     def test_operators_type_inference(self):
-        self.assertResult("SELECT 1 + meta('int')", Decimal(2))
-        self.assertResult("SELECT 1 + meta('str3')", Decimal(4))
+        self.assertResult("SELECT 1 + meta('int')", _D('2'))
+        self.assertResult("SELECT 1 + meta('str3')", _D('4'))
         self.assertResult("SELECT meta('int') > 0", True)
 
+        self.flushResults()
+
     def test_functions(self):
         # round
-        self.assertResult("SELECT round(1.2)", Decimal(1))
-        self.assertResult("SELECT round(1.234, 2)", Decimal('1.23'))
+        self.assertResult("SELECT round(1.2)", _D('1'))
+        self.assertResult("SELECT round(1.234, 2)", _D('1.23'))
         self.assertResult("SELECT round(12)", 12)
         self.assertResult("SELECT round(12, -1)", 10)
 
         # commodity_meta
         self.assertResult("SELECT commodity_meta('MISSING')", None, dict)
         self.assertResult("SELECT commodity_meta('TEST')",
-                          {'filename': '<string>', 'lineno': 2, 'rate': Decimal('42')})
-        self.assertResult("SELECT commodity_meta('TEST', 'rate')", Decimal('42'), object)
+                          {'filename': '<string>', 'lineno': 2, 'rate': _D('42')})
+        self.assertResult("SELECT commodity_meta('TEST', 'rate')", _D('42'), object)
+
+        self.flushResults()
 
     def test_coalesce(self):
         # coalesce
         self.assertResult("SELECT COALESCE(str(meta('missing')), '!')", "!")
         self.assertError ("SELECT COALESCE(meta('missing'), '!')")
 
+        self.flushResults()
+
+
+# Expected entries for the TestFilterEntries and TestExecutePrint tests.
+# These are parsed once at import time instead of in every
+# assertEqualEntries() call.
+_EXPECTED_BY_YEAR = cmptest.read_string_or_entries("""
+
+    2012-02-02 * "Dinner with Dos"
+      Assets:Bank:Checking              102.00 USD
+      Expenses:Restaurant              -102.00 USD
+
+""")
+
+
+_EXPECTED_BY_EXPR1 = cmptest.read_string_or_entries("""
+
+    2010-01-01 open Assets:Bank:Checking
+    2010-01-01 open Assets:Bank:Savings
+    2010-01-01 open Expenses:Restaurant
+    2010-01-01 open Assets:ForeignBank:Checking
+
+    2010-01-01 * "Dinner with Cero"
+      Assets:Bank:Checking              100.00 USD
+      Expenses:Restaurant              -100.00 USD
+
+    2011-01-01 * "Dinner with Uno"
+      Assets:Bank:Checking              101.00 USD
+      Expenses:Restaurant              -101.00 USD
+
+    2014-04-04 * "Dinner with Quatro"
+      Assets:Bank:Checking              104.00 USD
+      Expenses:Restaurant              -104.00 USD
+
+""")
+
+
+_EXPECTED_BY_EXPR2 = cmptest.read_string_or_entries("""
+
+    2010-01-01 open Assets:Bank:Checking
+    2010-01-01 open Assets:Bank:Savings
+    2010-01-01 open Expenses:Restaurant
+    2010-01-01 open Assets:ForeignBank:Checking
+
+    2010-01-01 * "Dinner with Cero"
+      Assets:Bank:Checking              100.00 USD
+      Expenses:Restaurant              -100.00 USD
+
+    2011-01-01 * "Dinner with Uno"
+      Assets:Bank:Checking              101.00 USD
+      Expenses:Restaurant              -101.00 USD
+
+    2012-02-02 * "Dinner with Dos"
+      Assets:Bank:Checking              102.00 USD
+      Expenses:Restaurant              -102.00 USD
+
+""")
+
+
+_EXPECTED_OPEN_DATED = cmptest.read_string_or_entries("""
+
+    2010-01-01 open Assets:Bank:Checking
+    2010-01-01 open Assets:Bank:Savings
+    2010-01-01 open Expenses:Restaurant
+    2010-01-01 open Assets:ForeignBank:Checking
+
+    2012-12-31 'S "Opening balance for 'Assets:Bank:Checking' (Summarization)"
+      Assets:Bank:Checking                                                   303.00 USD
+      Equity:Opening-Balances                                               -303.00 USD
+
+    2012-12-31 'S "Opening balance for 'Equity:Earnings:Previous' (Summarization)"
+      Equity:Earnings:Previous                                              -303.00 USD
+      Equity:Opening-Balances                                                303.00 USD
+
+    2013-03-03 * "Dinner with Tres"
+      Assets:Bank:Checking                                                   103.00 USD
+      Expenses:Restaurant                                                   -103.00 USD
+
+    2013-10-10 * "International Transfer"
+      Assets:Bank:Checking                                                   -50.00 USD                                   ;     -50.00 USD
+      Assets:ForeignBank:Checking                                            -60.00 CAD                        @ 1.20 USD ;     -72.00 USD
+
+    2014-04-04 * "Dinner with Quatro"
+      Assets:Bank:Checking                                                   104.00 USD
+      Expenses:Restaurant                                                   -104.00 USD
+
+""")
+
+
+_EXPECTED_CLOSE_UNDATED = cmptest.read_string_or_entries(CommonInputBase.INPUT + textwrap.dedent("""
+
+    2014-04-04 'C "Conversion for (-50.00 USD, -60.00 CAD)"
+      Equity:Conversions:Current  50.00 USD @ 0 NOTHING
+      Equity:Conversions:Current  60.00 CAD @ 0 NOTHING
+
+"""))
+
+
+_EXPECTED_CLEAR = cmptest.read_string_or_entries(CommonInputBase.INPUT + textwrap.dedent("""
+
+    2014-04-04 'T "Transfer balance for 'Expenses:Restaurant' (Transfer balance)"
+      Expenses:Restaurant                                 510.00 USD
+      Equity:Earnings:Current                            -510.00 USD
+
+"""))
+
+
+_EXPECTED_PRINT_ALL = cmptest.read_string_or_entries(CommonInputBase.INPUT)
+
 
 class TestFilterEntries(CommonInputBase, QueryBase):
 
@@ -341,13 +553,7 @@ class TestFilterEntries(CommonInputBase, QueryBase):
         filtered_entries = qx.filter_entries(self.compile("""
           SELECT date, type FROM year(date) = 2012;
         """).c_from, self.entries, self.options_map, self.context)
-        self.assertEqualEntries("""
-
-          2012-02-02 * "Dinner with Dos"
-            Assets:Bank:Checking              102.00 USD
-            Expenses:Restaurant              -102.00 USD
-
-        """, filtered_entries)
+        self.assertEqualEntries(_EXPECTED_BY_YEAR, filtered_entries)
 
     def test_filter_by_expr1(self):
         filtered_entries = qx.filter_entries(self.compile("""
@@ -355,64 +561,20 @@ class TestFilterEntries(CommonInputBase, QueryBase):
           FROM NOT (type = 'transaction' AND
                     (year(date) = 2012 OR year(date) = 2013));
         """).c_from, self.entries, self.options_map, self.context)
-        self.assertEqualEntries("""
-
-          2010-01-01 open Assets:Bank:Checking
-          2010-01-01 open Assets:Bank:Savings
-          2010-01-01 open Expenses:Restaurant
-          2010-01-01 open Assets:ForeignBank:Checking
-
-          2010-01-01 * "Dinner with Cero"
-            Assets:Bank:Checking              100.00 USD
-            Expenses:Restaurant              -100.00 USD
-
-          2011-01-01 * "Dinner with Uno"
-            Assets:Bank:Checking              101.00 USD
-            Expenses:Restaurant              -101.00 USD
-
-          2014-04-04 * "Dinner with Quatro"
-            Assets:Bank:Checking              104.00 USD
-            Expenses:Restaurant              -104.00 USD
-
-        """, filtered_entries)
+        self.assertEqualEntries(_EXPECTED_BY_EXPR1, filtered_entries)
 
     def test_filter_by_expr2(self):
         filtered_entries = qx.filter_entries(self.compile("""
           SELECT date, type FROM date < 2012-06-01;
         """).c_from, self.entries, self.options_map, self.context)
-        self.assertEqualEntries("""
-
-          2010-01-01 open Assets:Bank:Checking
-          2010-01-01 open Assets:Bank:Savings
-          2010-01-01 open Expenses:Restaurant
-          2010-01-01 open Assets:ForeignBank:Checking
-
-          2010-01-01 * "Dinner with Cero"
-            Assets:Bank:Checking              100.00 USD
-            Expenses:Restaurant              -100.00 USD
-
-          2011-01-01 * "Dinner with Uno"
-            Assets:Bank:Checking              101.00 USD
-            Expenses:Restaurant              -101.00 USD
-
-          2012-02-02 * "Dinner with Dos"
-            Assets:Bank:Checking              102.00 USD
-            Expenses:Restaurant              -102.00 USD
-
-        """, filtered_entries)
+        self.assertEqualEntries(_EXPECTED_BY_EXPR2, filtered_entries)
 
     def test_filter_close_undated(self):
         filtered_entries = qx.filter_entries(self.compile("""
           SELECT date, type FROM CLOSE;
         """).c_from, self.entries, self.options_map, self.context)
 
-        self.assertEqualEntries(self.INPUT + textwrap.dedent("""
-
-          2014-04-04 'C "Conversion for (-50.00 USD, -60.00 CAD)"
-            Equity:Conversions:Current  50.00 USD @ 0 NOTHING
-            Equity:Conversions:Current  60.00 CAD @ 0 NOTHING
-
-        """), filtered_entries)
+        self.assertEqualEntries(_EXPECTED_CLOSE_UNDATED, filtered_entries)
 
     def test_filter_close_dated(self):
         filtered_entries = qx.filter_entries(self.compile("""
@@ -425,47 +587,14 @@ class TestFilterEntries(CommonInputBase, QueryBase):
           SELECT date, type FROM OPEN ON 2013-01-01;
         """).c_from, self.entries, self.options_map, self.context)
 
-        self.assertEqualEntries("""
-
-          2010-01-01 open Assets:Bank:Checking
-          2010-01-01 open Assets:Bank:Savings
-          2010-01-01 open Expenses:Restaurant
-          2010-01-01 open Assets:ForeignBank:Checking
-
-          2012-12-31 'S "Opening balance for 'Assets:Bank:Checking' (Summarization)"
-            Assets:Bank:Checking                                                   303.00 USD
-            Equity:Opening-Balances                                               -303.00 USD
-
-          2012-12-31 'S "Opening balance for 'Equity:Earnings:Previous' (Summarization)"
-            Equity:Earnings:Previous                                              -303.00 USD
-            Equity:Opening-Balances                                                303.00 USD
-
-          2013-03-03 * "Dinner with Tres"
-            Assets:Bank:Checking                                                   103.00 USD
-            Expenses:Restaurant                                                   -103.00 USD
-
-          2013-10-10 * "International Transfer"
-            Assets:Bank:Checking                                                   -50.00 USD                                   ;     -50.00 USD
-            Assets:ForeignBank:Checking                                            -60.00 CAD                        @ 1.20 USD ;     -72.00 USD
-
-          2014-04-04 * "Dinner with Quatro"
-            Assets:Bank:Checking                                                   104.00 USD
-            Expenses:Restaurant                                                   -104.00 USD
-
-        """, filtered_entries)
+        self.assertEqualEntries(_EXPECTED_OPEN_DATED, filtered_entries)
 
     def test_filter_clear(self):
         filtered_entries = qx.filter_entries(self.compile("""
           SELECT date, type FROM CLEAR;
         """).c_from, self.entries, self.options_map, self.context)
 
-        self.assertEqualEntries(self.INPUT + textwrap.dedent("""
-
-          2014-04-04 'T "Transfer balance for 'Expenses:Restaurant' (Transfer balance)"
-            Expenses:Restaurant                                 510.00 USD
-            Equity:Earnings:Current                            -510.00 USD
-
-        """), filtered_entries)
+        self.assertEqualEntries(_EXPECTED_CLEAR, filtered_entries)
 
 
 class TestExecutePrint(CommonInputBase, QueryBase):
@@ -481,24 +610,21 @@ class TestExecutePrint(CommonInputBase, QueryBase):
         oss = io.StringIO()
         qx.execute_print(statement, self.entries, self.options_map, oss)
 
-        self.assertEqualEntries("""
-
-          2012-02-02 * "Dinner with Dos"
-            Assets:Bank:Checking                                                   102.00 USD
-            Expenses:Restaurant                                                   -102.00 USD
-
-        """, oss.getvalue())
+        self.assertEqualEntries(_EXPECTED_BY_YEAR, oss.getvalue())
 
     def test_print_with_no_filter(self):
         statement = qc.EvalPrint(qc.EvalFrom(None, None, None, None))
         oss = io.StringIO()
         qx.execute_print(statement, self.entries, self.options_map, oss)
-        self.assertEqualEntries(self.INPUT, oss.getvalue())
+        self.assertEqualEntries(_EXPECTED_PRINT_ALL, oss.getvalue())
+        printed = oss.getvalue()
 
+        # Without a FROM clause the output must be the very same, there
+        # is no need to parse it again for comparison.
         statement = qc.EvalPrint(None)
         oss = io.StringIO()
         qx.execute_print(statement, self.entries, self.options_map, oss)
-        self.assertEqualEntries(self.INPUT, oss.getvalue())
+        self.assertEqual(printed, oss.getvalue())
 
 
 class TestAllocation(unittest.TestCase):
@@ -551,6 +677,31 @@ class TestExecuteNonAggregatedQuery(QueryBase):
                 (datetime.date(2010, 2, 23), '*', None, 'Bla'),
                 ])
 
+    def test_non_aggregate__parsed(self):
+        self.check_query(
+            self.INPUT,
+            self.parse("SELECT date;"),
+            [('date', datetime.date)],
+            [(datetime.date(2010, 2, 23),),
+             (datetime.date(2010, 2, 23),)])
+
+    def test_non_aggregate__balance(self):
+        # The running balance is updated once per row even when the
+        # column appears multiple times in the targets.
+        self.check_query(
+            self.INPUT,
+            """
+            SELECT balance, balance AS again;
+            """,
+            [
+                ('balance', inventory.Inventory),
+                ('again', inventory.Inventory),
+                ],
+            [
+                (_I('100.00 USD'), _I('100.00 USD')),
+                (_I(''), _I('')),
+                ])
+
     def test_non_aggregated_order_by_visible(self):
         self.check_query(
             self.INPUT,
@@ -691,8 +842,8 @@ class TestExecuteAggregatedQuery(QueryBase):
                 ('amount', inventory.Inventory),
                 ],
             [
-                ('Assets:Bank:Checking', inventory.from_string('100.00 USD')),
-                ('Expenses:Restaurant', inventory.from_string('-100.00 USD')),
+                ('Assets:Bank:Checking', _I('100.00 USD')),
+                ('Expenses:Restaurant', _I('-100.00 USD')),
                 ])
 
     def test_aggregated_group_by_invisible(self):
@@ -726,8 +877,8 @@ class TestExecuteAggregatedQuery(QueryBase):
                 ('amount', inventory.Inventory),
                 ],
             [
-                ('Assets:Bank:Checking', inventory.from_string('100.00 USD')),
-                ('Expenses:Restaurant', inventory.from_string('-100.00 USD')),
+                ('Assets:Bank:Checking', _I('100.00 USD')),
+                ('Expenses:Restaurant', _I('-100.00 USD')),
                 ])
 
     def test_aggregated_group_by_visible_order_by_non_aggregate_invisible(self):
@@ -745,8 +896,8 @@ class TestExecuteAggregatedQuery(QueryBase):
                 ('amount', inventory.Inventory),
                 ],
             [
-                ('Expenses:Restaurant', inventory.from_string('-100.00 USD')),
-                ('Assets:Bank:Checking', inventory.from_string('100.00 USD')),
+                ('Expenses:Restaurant', _I('-100.00 USD')),
+                ('Assets:Bank:Checking', _I('100.00 USD')),
                 ])
 
     def test_aggregated_group_by_visible_order_by_aggregate_visible(self):
@@ -773,9 +924,9 @@ class TestExecuteAggregatedQuery(QueryBase):
                 ('sum', Decimal),
                 ],
             [
-                ('Liabilities:Credit-Card', 1, D('-2.00')),
-                ('Assets:Bank:Checking', 1, D('-1.00')),
-                ('Expenses:Restaurant', 2, D('3.00')),
+                ('Liabilities:Credit-Card', 1, _D('-2.00')),
+                ('Assets:Bank:Checking', 1, _D('-1.00')),
+                ('Expenses:Restaurant', 2, _D('3.00')),
                 ])
 
     def test_aggregated_group_by_visible_order_by_aggregate_invisible(self):
@@ -821,8 +972,8 @@ class TestExecuteAggregatedQuery(QueryBase):
                 ('amount', inventory.Inventory),
                 ],
             [
-                (19, inventory.from_string('-100.00 USD'),),
-                (20, inventory.from_string('100.00 USD'),),
+                (19, _I('-100.00 USD'),),
+                (20, _I('100.00 USD'),),
                 ])
 
     def test_aggregated_group_by_invisible_order_by_non_aggregate_invis(self):
@@ -875,9 +1026,9 @@ class TestExecuteAggregatedQuery(QueryBase):
                 ('sum', Decimal),
                 ],
             [
-                (1, D('-2.00')),
-                (1, D('-1.00')),
-                (2, D('3.00')),
+                (1, _D('-2.00')),
+                (1, _D('-1.00')),
+                (2, _D('3.00')),
                 ])
 
     def test_aggregated_group_by_invisible_order_by_aggregate_invisible(self):
@@ -929,8 +1080,8 @@ class TestExecuteAggregatedQuery(QueryBase):
                 ('sum(number)', Decimal),
             ],
             [
-                ('Expenses:Bar', D(2.0)),
-                ('Expenses:Foo', D(1.0)),
+                ('Expenses:Bar', _D(2.0)),
+                ('Expenses:Foo', _D(1.0)),
             ])
 
 
@@ -948,6 +1099,16 @@ class TestExecuteOptions(QueryBase):
 
     """
 
+    # The rows of INPUT, ordered by ascending number.
+    ROWS_ASC = [
+        ('Equity:Rest', _D('-15.00')),
+        ('Assets:AssetE', _D('1.00')),
+        ('Assets:AssetD', _D('2.00')),
+        ('Assets:AssetC', _D('3.00')),
+        ('Assets:AssetB', _D('4.00')),
+        ('Assets:AssetA', _D('5.00')),
+    ]
+
     def test_order_by_asc_implicit(self):
         self.check_query(
             self.INPUT,
@@ -958,14 +1119,7 @@ class TestExecuteOptions(QueryBase):
                 ('account', str),
                 ('number', Decimal),
                 ],
-            [
-                ('Equity:Rest', D('-15.00')),
-                ('Assets:AssetE', D('1.00')),
-                ('Assets:AssetD', D('2.00')),
-                ('Assets:AssetC', D('3.00')),
-                ('Assets:AssetB', D('4.00')),
-                ('Assets:AssetA', D('5.00')),
-                ])
+            self.ROWS_ASC)
 
     def test_order_by_asc_explicit(self):
         self.check_query(
@@ -977,14 +1131,7 @@ class TestExecuteOptions(QueryBase):
                 ('account', str),
                 ('number', Decimal),
                 ],
-            [
-                ('Equity:Rest', D('-15.00')),
-                ('Assets:AssetE', D('1.00')),
-                ('Assets:AssetD', D('2.00')),
-                ('Assets:AssetC', D('3.00')),
-                ('Assets:AssetB', D('4.00')),
-                ('Assets:AssetA', D('5.00')),
-                ])
+            self.ROWS_ASC)
 
     def test_order_by_desc(self):
         self.check_query(
@@ -996,14 +1143,7 @@ class TestExecuteOptions(QueryBase):
                 ('account', str),
                 ('number', Decimal),
                 ],
-            [
-                ('Assets:AssetA', D('5.00')),
-                ('Assets:AssetB', D('4.00')),
-                ('Assets:AssetC', D('3.00')),
-                ('Assets:AssetD', D('2.00')),
-                ('Assets:AssetE', D('1.00')),
-                ('Equity:Rest', D('-15.00')),
-                ])
+            self.ROWS_ASC[::-1])
 
     def test_distinct(self):
         self.check_sorted_query(
@@ -1058,11 +1198,7 @@ class TestExecuteOptions(QueryBase):
                 ('account', str),
                 ('number', Decimal),
                 ],
-            [
-                ('Equity:Rest', D('-15.00')),
-                ('Assets:AssetE', D('1.00')),
-                ('Assets:AssetD', D('2.00')),
-                ])
+            self.ROWS_ASC[:3])
 
 
 class TestOrderBy(QueryBase):
@@ -1084,12 +1220,13 @@ class TestOrderBy(QueryBase):
 
     """
 
+    # The result columns of the queries below.
+    COLUMNS = [('account', str), ('a', object), ('b', object)]
+
     def test_order_by_asc_asc(self):
         self.check_query(self.data,
             """SELECT account, meta('aa') AS a, meta('bb') AS b ORDER BY 2, 3""",
-            [
-                ('account', str), ('a', object), ('b', object)
-            ],
+            self.COLUMNS,
             [
                 ('Expenses:Tests', None, None),
                 ('Assets:Tests', 1, 1),
@@ -1101,9 +1238,7 @@ class TestOrderBy(QueryBase):
     def test_order_by_asc_desc(self):
         self.check_query(self.data,
             """SELECT account, meta('aa') AS a, meta('bb') AS b ORDER BY 2, 3 DESC""",
-            [
-                ('account', str), ('a', object), ('b', object)
-            ],
+            self.COLUMNS,
             [
                 ('Expenses:Tests', None, None),
                 ('Assets:Tests', 1, 2),
@@ -1115,9 +1250,7 @@ class TestOrderBy(QueryBase):
     def test_order_by_desc_asc(self):
         self.check_query(self.data,
             """SELECT account, meta('aa') AS a, meta('bb') AS b ORDER BY 2 DESC, 3""",
-            [
-                ('account', str), ('a', object), ('b', object)
-            ],
+            self.COLUMNS,
             [
                 ('Assets:Tests', 2, None),
                 ('Assets:Tests', 2, 1),
@@ -1129,9 +1262,7 @@ class TestOrderBy(QueryBase):
     def test_order_by_desc_desc(self):
         self.check_query(self.data,
             """SELECT account, meta('aa') AS a, meta('bb') AS b ORDER BY 2 DESC, 3 DESC""",
-            [
-                ('account', str), ('a', object), ('b', object)
-            ],
+            self.COLUMNS,
             [
                 ('Assets:Tests', 2, 1),
                 ('Assets:Tests', 2, None),
@@ -1140,6 +1271,28 @@ class TestOrderBy(QueryBase):
                 ('Expenses:Tests', None, None),
             ])
 
+    def test_order_by_asc_asc_desc(self):
+        self.check_query(self.data,
+            """SELECT account, meta('aa') AS a, meta('bb') AS b ORDER BY 1, 2, 3 DESC""",
+            self.COLUMNS,
+            [
+                ('Assets:Tests', 1, 2),
+                ('Assets:Tests', 1, 1),
+                ('Assets:Tests', 2, 1),
+                ('Assets:Tests', 2, None),
+                ('Expenses:Tests', None, None),
+            ])
+
+    def test_order_by_desc_desc_limit(self):
+        self.check_query(self.data,
+            """SELECT account, meta('aa') AS a, meta('bb') AS b ORDER BY 2 DESC, 3 DESC LIMIT 3""",
+            self.COLUMNS,
+            [
+                ('Assets:Tests', 2, 1),
+                ('Assets:Tests', 2, None),
+                ('Assets:Tests', 1, 2),
+            ])
+
 
 class TestArithmeticFunctions(QueryBase):
 
@@ -1157,7 +1310,7 @@ class TestArithmeticFunctions(QueryBase):
               SELECT number + 3 as result;
             """,
             [('result', Decimal)],
-            [(D("8"),)])
+            [(_D("8"),)])
 
     def test_sub(self):
         self.check_query(
@@ -1169,7 +1322,7 @@ class TestArithmeticFunctions(QueryBase):
               SELECT number - 3 as result;
             """,
             [('result', Decimal)],
-            [(D("2"),)])
+            [(_D("2"),)])
 
     def test_mul(self):
         self.check_query(
@@ -1181,7 +1334,7 @@ class TestArithmeticFunctions(QueryBase):
               SELECT number * 1.2 as result;
             """,
             [('result', Decimal)],
-            [(D("6"),)])
+            [(_D("6"),)])
 
     def test_div(self):
         self.check_query(
@@ -1193,7 +1346,7 @@ class TestArithmeticFunctions(QueryBase):
               SELECT number / 2 as result;
             """,
             [('result', Decimal)],
-            [(D("2.50"),)])
+            [(_D("2.50"),)])
 
         # Test dbz, should fail result query.
         with self.assertRaises(decimal.DivisionByZero):
@@ -1206,7 +1359,7 @@ class TestArithmeticFunctions(QueryBase):
                   SELECT number / 0 as result;
                 """,
                 [('result', Decimal)],
-                [(D("2.50"),)])
+                [(_D("2.50"),)])
 
     def test_safe_div(self):
         self.check_query(
@@ -1218,7 +1371,7 @@ class TestArithmeticFunctions(QueryBase):
               SELECT SAFEDIV(number, 0) as result;
             """,
             [('result', Decimal)],
-            [(D("0"),)])
+            [(_D("0"),)])
 
     def test_safe_div_zerobyzero(self):
         self.check_query(
@@ -1230,15 +1383,19 @@ class TestArithmeticFunctions(QueryBase):
               SELECT SAFEDIV(0.0, 0) as result;
             """,
             [('result', Decimal)],
-            [(D("0"),)])
+            [(_D("0"),)])
 
 
 class TestExecutePivot(QueryBase):
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.entries, cls.errors, cls.options = _load_cached(cls.data)
+
     def setUp(self):
         super().setUp()
-        self.entries, errors, self.options = loader.load_string(self.data, dedent=True)
-        self.assertFalse(errors)
+        self.assertFalse(self.errors)
 
     def execute(self, query):
         query = self.compile(query)
@@ -1282,6 +1439,20 @@ class TestExecutePivot(QueryBase):
         Assets:Cash
     """
 
+    # The result of the one column pivot of the balance by year.
+    EXPECTED_ONE_COLUMN = (
+        [
+            ('account/year', str),
+            ('2012', inventory.Inventory),
+            ('2013', inventory.Inventory),
+            ('2014', inventory.Inventory),
+            ('2015', inventory.Inventory),
+        ],
+        [
+            ('Expenses:Aaa', _I('5.00 USD'), _I('4.00 USD'), _I('6.00 USD'), _I('8.00 USD')),
+            ('Expenses:Bbb', _I('1.00 USD'), _I('7.00 USD'), _I('5.00 USD'), None),
+        ])
+
     def test_pivot_one_column(self):
         self.assertEqual(self.execute("""
             SELECT
@@ -1291,18 +1462,7 @@ class TestExecutePivot(QueryBase):
             WHERE
               account ~ 'Expenses'
             GROUP BY 1, 2
-            PIVOT BY 1, 2"""), (
-            [
-                ('account/year', str),
-                ('2012', inventory.Inventory),
-                ('2013', inventory.Inventory),
-                ('2014', inventory.Inventory),
-                ('2015', inventory.Inventory),
-            ],
-            [
-                ('Expenses:Aaa', I('5.00 USD'), I('4.00 USD'), I('6.00 USD'), I('8.00 USD')),
-                ('Expenses:Bbb', I('1.00 USD'), I('7.00 USD'), I('5.00 USD'), None),
-            ]))
+            PIVOT BY 1, 2"""), self.EXPECTED_ONE_COLUMN)
 
     def test_pivot_one_column_by_name(self):
         self.assertEqual(self.execute("""
@@ -1313,18 +1473,7 @@ class TestExecutePivot(QueryBase):
             WHERE
               account ~ 'Expenses'
             GROUP BY 1, 2
-            PIVOT BY account, year"""), (
-            [
-                ('account/year', str),
-                ('2012', inventory.Inventory),
-                ('2013', inventory.Inventory),
-                ('2014', inventory.Inventory),
-                ('2015', inventory.Inventory),
-            ],
-            [
-                ('Expenses:Aaa', I('5.00 USD'), I('4.00 USD'), I('6.00 USD'), I('8.00 USD')),
-                ('Expenses:Bbb', I('1.00 USD'), I('7.00 USD'), I('5.00 USD'), None),
-            ]))
+            PIVOT BY account, year"""), self.EXPECTED_ONE_COLUMN)
 
     def test_pivot_two_column(self):
         self.assertEqual(self.execute("""
@@ -1346,6 +1495,6 @@ class TestExecutePivot(QueryBase):
                 ('2015/updated', datetime.date),
             ],
             [
-                ('Expenses:Aaa', I('6.00 USD'), datetime.date(2014, 3, 3), I('8.00 USD'), datetime.date(2015, 4, 4)),
-                ('Expenses:Bbb', I('5.00 USD'), datetime.date(2014, 2, 2), None, None),
+                ('Expenses:Aaa', _I('6.00 USD'), datetime.date(2014, 3, 3), _I('8.00 USD'), datetime.date(2015, 4, 4)),
+                ('Expenses:Bbb', _I('5.00 USD'), datetime.date(2014, 2, 2), None, None),
             ]))
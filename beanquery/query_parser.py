@@ -4,17 +4,26 @@ __copyright__ = "Copyright (C) 2014-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
 import collections
+import contextlib
 import datetime
 import enum
+import functools
 import io
 import numbers
+import operator
+import os
+import pickle
+import sys
+import threading
+import types
+
+from decimal import Decimal
 
 import dateutil.parser
 
 import ply.lex
 import ply.yacc
 
-from beancount.core.number import D
 from beancount.utils.misc_utils import cmptuple
 
 
@@ -111,6 +120,13 @@ class Ordering(enum.IntEnum):
     def __repr__(self):
         return "%s.%s" % (self.__class__.__name__, self.name)
 
+# Map the optional ordering keyword to the sort order.
+_ORDER_MAP = {
+    None: Ordering.ASC,
+    'ASC': Ordering.ASC,
+    'DESC': Ordering.DESC,
+}
+
 # An PIVOT BY clause.
 #
 # Attributes:
@@ -121,70 +137,165 @@ PivotBy = cmptuple('PivotBy', 'columns')
 # your run-of-the-mill hierarchical logical expression nodes. Any of these nodes
 # equivalent form "an expression."
 
-# A reference to a column.
-#
-# Attributes:
-#   name: A string, the name of the column to access.
-Column = cmptuple('Column', 'name')
+class Node:
+    """Base class for expression nodes.
 
-# A function call.
-#
-# Attributes:
-#   fname: A string, the name of the function.
-#   operands: A list of other expressions, the arguments of the function to
-#     evaluate. This is possibly an empty list.
-Function = cmptuple('Function', 'fname operands')
+    Like 'cmptuple' instances, nodes compare equal when they are of the
+    same type and their attributes compare equal. Expression nodes are
+    the most numerous objects in a parsed query, thus their attributes
+    are stored in slots instead of in a tuple.
+    """
+    __slots__ = ()
 
-# A constant node.
-#
-# Attributes:
-#   value: The constant value this represents.
-Constant = cmptuple('Constant', 'value')
+    # The names of the node attributes, in declaration order. This is
+    # computed from the '__slots__' of the class and of its bases.
+    _fields = ()
 
-# Base classes for unary operators.
-#
-# Attributes:
-#   operand: An expression, the operand of the operator.
-UnaryOp = cmptuple('UnaryOp', 'operand')
+    # The lowercase name of the node type, used to name expressions.
+    node_name = 'node'
 
-# Base classes for binary operators.
-#
-# Attributes:
-#   left: An expression, the left operand.
-#   right: An expression, the right operand.
-BinaryOp = cmptuple('BinaryOp', 'left right')
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.node_name = cls.__name__.lower()
+        cls._fields = cls._fields + tuple(cls.__dict__.get('__slots__', ()))
+        # A plain callable, not a function, thus not bound on attribute access.
+        cls._values = operator.attrgetter(*cls._fields)
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return False
+        return self._values(self) == other._values(other)
+
+    def __hash__(self):
+        return hash((type(self), self._values(self)))
+
+    def __repr__(self):
+        attributes = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._fields)
+        return f'{type(self).__name__}({attributes})'
+
+
+class Column(Node):
+    """A reference to a column.
+
+    Attributes:
+      name: A string, the name of the column to access.
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Function(Node):
+    """A function call.
+
+    Attributes:
+      fname: A string, the name of the function.
+      operands: A list of other expressions, the arguments of the function to
+        evaluate. This is possibly an empty list.
+    """
+    __slots__ = ('fname', 'operands')
+
+    def __init__(self, fname, operands):
+        self.fname = fname
+        self.operands = operands
+
+
+class Constant(Node):
+    """A constant node.
+
+    Attributes:
+      value: The constant value this represents.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class UnaryOp(Node):
+    """Base class for unary operators.
+
+    Attributes:
+      operand: An expression, the operand of the operator.
+    """
+    __slots__ = ('operand',)
+
+    def __init__(self, operand):
+        self.operand = operand
+
+
+class BinaryOp(Node):
+    """Base class for binary operators.
+
+    Attributes:
+      left: An expression, the left operand.
+      right: An expression, the right operand.
+    """
+    __slots__ = ('left', 'right')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+
+class LogicalOp(Node):
+    """Base class for logical operators taking any number of operands.
+
+    Chains of the same operator are collapsed into a single node at
+    parse time, thus 'a AND b AND c' is represented as And([a, b, c]).
+
+    Attributes:
+      operands: A list of expressions, the operands of the operator.
+    """
+    __slots__ = ('operands',)
+
+    def __init__(self, operands):
+        self.operands = operands
+
+    @property
+    def left(self):
+        """The left operand, as if the node was a left-associative binary operator."""
+        if len(self.operands) == 2:
+            return self.operands[0]
+        return type(self)(self.operands[:-1])
+
+    @property
+    def right(self):
+        """The right operand, as if the node was a left-associative binary operator."""
+        return self.operands[-1]
 
 # pylint: disable=multiple-statements
 
 # Negation operator.
-class Not(UnaryOp): pass
+class Not(UnaryOp): __slots__ = ()
 
-class IsNull(UnaryOp): pass
-class IsNotNull(UnaryOp): pass
+class IsNull(UnaryOp): __slots__ = ()
+class IsNotNull(UnaryOp): __slots__ = ()
 
 # Logical and/or operators.
-class And(BinaryOp): pass
-class Or(BinaryOp): pass
+class And(LogicalOp): __slots__ = ()
+class Or(LogicalOp): __slots__ = ()
 
 # Equality and inequality comparison operators.
-class Equal(BinaryOp): pass
-class Greater(BinaryOp): pass
-class GreaterEq(BinaryOp): pass
-class Less(BinaryOp): pass
-class LessEq(BinaryOp): pass
+class Equal(BinaryOp): __slots__ = ()
+class Greater(BinaryOp): __slots__ = ()
+class GreaterEq(BinaryOp): __slots__ = ()
+class Less(BinaryOp): __slots__ = ()
+class LessEq(BinaryOp): __slots__ = ()
 
 # A regular expression match operator.
-class Match(BinaryOp): pass
+class Match(BinaryOp): __slots__ = ()
 
 # Membership operators.
-class Contains(BinaryOp): pass
+class Contains(BinaryOp): __slots__ = ()
 
 # Arithmetic operators.
-class Neg(UnaryOp): pass
-class Mul(BinaryOp): pass
-class Div(BinaryOp): pass
-class Add(BinaryOp): pass
-class Sub(BinaryOp): pass
+class Neg(UnaryOp): __slots__ = ()
+class Mul(BinaryOp): __slots__ = ()
+class Div(BinaryOp): __slots__ = ()
+class Add(BinaryOp): __slots__ = ()
+class Sub(BinaryOp): __slots__ = ()
 
 # pylint: enable=multiple-statements
 
@@ -192,6 +303,42 @@ class ParseError(Exception):
     """A parser error."""
 
 
+def _fold_logical(node, left, right):
+    """Build a logical operation node, collapsing chains of the same operator.
+
+    Args:
+      node: The LogicalOp subclass to build.
+      left: The left operand node.
+      right: The right operand node.
+    Returns:
+      An instance of 'node' extending the operands of 'left' if it is an
+      instance of the same operator, of 'left' and 'right' otherwise.
+    """
+    # Compare the exact types: a node of a subclass of the operator is
+    # not part of a chain of the same operator.
+    if type(left) is node:  # pylint: disable=unidiomatic-typecheck
+        return node(left.operands + [right])
+    return node([left, right])
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_iso_date(string):
+    """Parse a date in ISO 8601 format, memoizing the result."""
+    return datetime.datetime.strptime(string, '%Y-%m-%d').date()
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_fuzzy_date(string, today):
+    """Parse a date in any format supported by dateutil, memoizing the result.
+
+    The fields missing from the string are taken from the 'today' date,
+    as dateutil does by default: the date is part of the memoization
+    key, not to return stale dates after the day changes.
+    """
+    default = datetime.datetime.combine(today, datetime.time())
+    return dateutil.parser.parse(string, default=default).date()
+
+
 class Lexer:
     """PLY lexer for the Beancount Query Language.
     """
@@ -204,6 +351,9 @@ class Lexer:
         'OR', 'NOT', 'IN', 'IS', 'TRUE', 'FALSE', 'NULL',
     }
 
+    # Map the reserved keywords to themselves, to lookup identifiers.
+    keywords_map = {keyword: keyword for keyword in keywords}
+
     # List of valid tokens from the lexer.
     tokens = [
         'ID', 'INTEGER', 'DECIMAL', 'STRING', 'DATE', 'COMMA', 'SEMI',
@@ -213,17 +363,19 @@ class Lexer:
 
     # Support c-stype comments syntax */
     def t_COMMENT(self, token):
-        r"(/\*([^*]|[\r\n]|(\*+([^*/]|[\r\n])))*\*+/)"
+        r"/\*[^*]*\*+(?:[^/*][^*]*\*+)*/"
 
     # An identifier, for a column or a dimension or whatever.
     def t_ID(self, token):
         "[a-zA-Z][a-zA-Z0-9_]*"
-        utoken = token.value.upper()
-        if utoken in self.keywords:
-            token.type = utoken
-            token.value = utoken
+        keyword = self.keywords_map.get(token.value.upper())
+        if keyword is not None:
+            token.type = keyword
+            token.value = keyword
         else:
-            token.value = token.value.lower()
+            # Identifiers are repeated in queries and compared while
+            # compiling them: intern them to share a single instance.
+            token.value = sys.intern(token.value.lower())
         return token
 
     def t_STRING(self, token):
@@ -234,9 +386,9 @@ class Lexer:
     def t_DATE(self, token):
         r"(\#(\"[^\"]*\"|\'[^\']*\')|\d\d\d\d-\d\d-\d\d)"
         if token.value[0] == '#':
-            token.value = dateutil.parser.parse(token.value[2:-1]).date()
+            token.value = _parse_fuzzy_date(token.value[2:-1], datetime.date.today())
         else:
-            token.value = datetime.datetime.strptime(token.value, '%Y-%m-%d').date()
+            token.value = _parse_iso_date(token.value)
         return token
 
     # Constant tokens.
@@ -259,7 +411,9 @@ class Lexer:
     # Numbers.
     def t_DECIMAL(self, token):
         r"([0-9]+\.[0-9]*|[0-9]*\.[0-9]+)"
-        token.value = D(token.value)
+        # The regular expression matches only valid numbers without
+        # thousands separators, the value can be converted directly.
+        token.value = Decimal(token.value)
         return token
 
     def t_INTEGER(self, token):
@@ -275,41 +429,219 @@ class Lexer:
         raise ParseError("Unknown token: {}".format(token))
 
 
+def _tables_cache_filename(name):
+    """Return the name of the file caching the parser tables.
+
+    The PLY parser tables are cached in the user cache directory, along
+    with the signature of the grammar: the tables are regenerated when
+    it does not match.
+
+    Args:
+      name: A string, the name of the parser.
+    Returns:
+      A filename, or None if the cache directory is not writable.
+    """
+    cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                             os.path.expanduser('~/.cache'), 'beanquery')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return None
+    if not os.access(cache_dir, os.W_OK):
+        return None
+    return os.path.join(cache_dir, '{}.pickle'.format(name))
+
+
+def _read_tables(filename, signature):
+    """Load the parser tables from the cache.
+
+    Args:
+      filename: A string, the name of the file caching the tables.
+      signature: A string, the signature of the grammar.
+    Returns:
+      A module object holding the tables, as the table modules generated
+      by PLY, or None if the file does not exist, is corrupted, or does
+      not hold the tables for the given grammar signature.
+    """
+    try:
+        with open(filename, 'rb') as infile:
+            tables = pickle.load(infile)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    # Files written by PLY itself store the tables in another format.
+    if (not isinstance(tables, dict) or
+        tables.get('_tabversion') != ply.yacc.__tabversion__ or
+        tables.get('_lr_signature') != signature):
+        return None
+    module = types.ModuleType('parsetab')
+    module.__file__ = filename
+    vars(module).update(tables)
+    return module
+
+
+def _write_tables(filename, signature, method, parser):
+    """Store the parser tables in the cache.
+
+    The tables are written to a temporary file moved in place, thus
+    concurrent processes never read a partially written file.
+
+    Args:
+      filename: A string, the name of the file caching the tables.
+      signature: A string, the signature of the grammar.
+      method: A string, the method used to generate the tables.
+      parser: The ply.yacc.LRParser built from the generated tables.
+    """
+    productions = []
+    for prod in parser.productions:
+        if prod.func:
+            productions.append((prod.str, prod.name, prod.len, prod.func,
+                                os.path.basename(prod.file), prod.line))
+        else:
+            productions.append((str(prod), prod.name, prod.len, None, None, None))
+    tables = {
+        '_tabversion': ply.yacc.__tabversion__,
+        '_lr_method': method,
+        '_lr_signature': signature,
+        '_lr_action': parser.action,
+        '_lr_goto': parser.goto,
+        '_lr_productions': productions,
+    }
+    tmpfile = '{}.{}-{}'.format(filename, os.getpid(), threading.get_ident())
+    try:
+        with open(tmpfile, 'wb') as outfile:
+            pickle.dump(tables, outfile, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfile, filename)
+    except OSError:
+        # Caching the tables is only an optimization.
+        with contextlib.suppress(OSError):
+            os.remove(tmpfile)
+
+
 class SelectParser(Lexer):
     """PLY parser for the Beancount Query Language's SELECT statement.
     """
 
     start = 'select_statement'
 
+    # The state of the statement being parsed, per thread. This is shared
+    # by all the instances because the parser callbacks are bound to the
+    # instance that was used to build the shared parser tables.
+    _state = threading.local()
+
+    # Serializes the construction of the shared instance and tables.
+    _lock = threading.RLock()
+
+    @classmethod
+    def get(cls):
+        """Return a parser instance shared by the whole process.
+
+        Building a parser is expensive, while a parser instance can be
+        used to parse multiple statements, also from multiple threads.
+
+        Returns:
+          An instance of this parser class.
+        """
+        # Look up the instance in the class dictionary, not to return the
+        # instance of a base class.
+        parser = cls.__dict__.get('_instance')
+        if parser is None:
+            with cls._lock:
+                parser = cls.__dict__.get('_instance')
+                if parser is None:
+                    parser = cls()
+                    cls._instance = parser
+        return parser
+
     def __init__(self, **options):
-        self.lexer = ply.lex.lex(module=self,
-                                 optimize=False,
-                                 debuglog=None,
-                                 debug=False)
-        self.parser = ply.yacc.yacc(module=self,
-                                    optimize=False,
-                                    write_tables=False,
-                                    debuglog=None,
-                                    debug=False,
-                                    **options)
-
-        # The default value to use for the close date.
-        self.default_close_date = None
+        if options:
+            self.lexer, self.parser = self._build(**options)
+        else:
+            # Build the lexer and the parser tables once per class: the
+            # PLY introspection of the grammar rules is expensive.
+            cls = type(self)
+            with cls._lock:
+                tables = cls.__dict__.get('_tables')
+                if tables is None:
+                    tables = self._build()
+                    cls._tables = tables
+            self.lexer, self.parser = tables
+
+        # Memoize the parsed statements. The syntax trees are never modified
+        # after construction thus they can be shared between the callers.
+        self._parse_cached = functools.lru_cache(maxsize=256)(self._parse)
+
+    def _build(self, **options):
+        """Build the PLY lexer and parser for the grammar of this class.
+
+        Args:
+          options: Additional options for ply.yacc.yacc().
+        Returns:
+          A (lexer, parser) tuple, with the callbacks bound to this instance.
+        """
+        lexer = ply.lex.lex(module=self,
+                            optimize=False,
+                            debuglog=None,
+                            debug=False)
+        # Generating the parser tables is expensive, load them from the
+        # cache when possible.
+        filename = _tables_cache_filename(type(self).__name__)
+        if filename is None:
+            return lexer, self._yacc(**options)
+        signature = self._signature()
+        tables = _read_tables(filename, signature)
+        if tables is not None:
+            return lexer, self._yacc(tabmodule=tables, **options)
+        parser = self._yacc(**options)
+        _write_tables(filename, signature, options.get('method', 'LALR'), parser)
+        return lexer, parser
+
+    def _yacc(self, **options):
+        """Build the PLY parser for the grammar of this class."""
+        return ply.yacc.yacc(module=self,
+                             optimize=False,
+                             write_tables=False,
+                             debuglog=None,
+                             debug=False,
+                             **options)
+
+    def _signature(self):
+        """Return the signature PLY computes to match the tables to the grammar."""
+        pinfo = ply.yacc.ParserReflect({name: getattr(self, name) for name in dir(self)},
+                                       log=ply.yacc.NullLogger())
+        pinfo.get_all()
+        return pinfo.signature()
+
+    @property
+    def default_close_date(self):
+        """The default value to use for the close date."""
+        return getattr(self._state, 'default_close_date', None)
 
     def tokenize(self, line):
-        self.lexer.input(line)
+        # Use a copy of the lexer, the lexer holds the state of the input.
+        lexer = self.lexer.clone()
+        lexer.input(line)
         while True:
-            tok = self.lexer.token()
+            tok = lexer.token()
             if not tok:
                 break
             yield tok
 
     def parse(self, line, debug=False, default_close_date=None):
+        if debug:
+            return self._parse(line, default_close_date, debug=debug)
+        # Dates in fuzzy formats are completed with the current date, thus
+        # the cached statements are valid for the current day only.
+        return self._parse_cached(line, default_close_date, datetime.date.today())
+
+    def _parse(self, line, default_close_date, today=None, debug=False):
+        # The 'today' argument is only used as part of the cache key.
+        del today
         try:
-            self.default_close_date = default_close_date
-            return self.parser.parse(line, lexer=self.lexer, debug=debug)
+            self._state.default_close_date = default_close_date
+            # Use a copy of the lexer, the lexer holds the state of the input.
+            return self.parser.parse(line, lexer=self.lexer.clone(), debug=debug)
         finally:
-            self.default_close_date = None
+            self._state.default_close_date = None
 
     def handle_comma_separated_list(self, p):
         """Handle a list of 0, 1 or more comma-separated values.
@@ -318,7 +650,10 @@ class SelectParser(Lexer):
         """
         if len(p) == 2:
             return [] if p[1] is None else [p[1]]
-        return p[1] + [p[3]]
+        # The list is built by this same rule in an earlier reduction
+        # and is not referenced elsewhere: extend it in place.
+        p[1].append(p[3])
+        return p[1]
 
     def p_account(self, p):
         """
@@ -462,7 +797,7 @@ class SelectParser(Lexer):
         """
         order_expr : expr_index ordering
         """
-        p[0] = OrderBy(p[1], Ordering[p[2] or 'ASC'])
+        p[0] = OrderBy(p[1], _ORDER_MAP[p[2]])
 
     def p_ordering(self, p):
         """
@@ -523,11 +858,11 @@ class SelectParser(Lexer):
 
     def p_expression_and(self, p):
         "expression : expression AND expression"
-        p[0] = And(p[1], p[3])
+        p[0] = _fold_logical(And, p[1], p[3])
 
     def p_expression_or(self, p):
         "expression : expression OR expression"
-        p[0] = Or(p[1], p[3])
+        p[0] = _fold_logical(Or, p[1], p[3])
 
     def p_expression_not(self, p):
         "expression : NOT expression"
@@ -569,13 +904,20 @@ class SelectParser(Lexer):
         "expression : expression IN expression"
         p[0] = Contains(p[1], p[3])
 
+    # Columns and constants are reduced to expressions directly, instead
+    # of through intermediate nonterminals, to save one or more parser
+    # callbacks for each leaf of the expression trees.
+
     def p_expression_column(self, p):
-        "expression : column"
-        p[0] = p[1]
+        "expression : ID"
+        p[0] = Column(p[1])
 
     def p_expression_constant(self, p):
-        "expression : constant"
-        p[0] = p[1]
+        """
+        expression : literal
+                   | list
+        """
+        p[0] = Constant(p[1])
 
     def p_expression_mul(self, p):
         "expression : expression ASTERISK expression"
@@ -634,15 +976,31 @@ class SelectParser(Lexer):
 
     def p_literal(self, p):
         """
-        literal : NULL
-                | boolean
-                | INTEGER
+        literal : INTEGER
                 | DECIMAL
                 | STRING
                 | DATE
         """
         p[0] = p[1]
 
+    def p_literal_null(self, p):
+        """
+        literal : NULL
+        """
+        p[0] = None
+
+    def p_literal_true(self, p):
+        """
+        literal : TRUE
+        """
+        p[0] = True
+
+    def p_literal_false(self, p):
+        """
+        literal : FALSE
+        """
+        p[0] = False
+
     def p_literal_list(self, p):
         """
         literals_list : literal COMMA
@@ -654,14 +1012,8 @@ class SelectParser(Lexer):
         literals_list : literals_list literal
                       | literals_list literal COMMA
         """
-        p[0] = p[1] + [p[2]]
-
-    def p_constant(self, p):
-        """
-        constant : literal
-                 | list
-        """
-        p[0] = Constant(p[1] if p[1] != 'NULL' else None)
+        p[1].append(p[2])
+        p[0] = p[1]
 
     def p_list(self, p):
         """
@@ -669,13 +1021,6 @@ class SelectParser(Lexer):
         """
         p[0] = p[2]
 
-    def p_boolean(self, p):
-        """
-        boolean : TRUE
-                | FALSE
-        """
-        p[0] = (p[1] == 'TRUE')
-
     def p_empty(self, _):
         """
         empty :
@@ -689,7 +1034,7 @@ class SelectParser(Lexer):
         oss.write("ERROR: Syntax error near '{}' (at {})\n".format(token.value,
                                                                    token.lexpos))
         oss.write("  ")
-        oss.write(self.lexer.lexdata)
+        oss.write(token.lexer.lexdata)
         oss.write("\n")
         oss.write("  {}^".format(' ' * token.lexpos))
         raise ParseError(oss.getvalue())
@@ -746,30 +1091,60 @@ class Parser(SelectParser):
         p[0] = Print(p[2])
 
 
-def get_expression_name(expr):
-    """Come up with a reasonable identifier for an expression.
+def _expression_operands(expr):
+    """Return the operands of an operator or function expression node.
 
     Args:
       expr: An expression node.
+    Returns:
+      A sequence of expression nodes.
     """
-    if isinstance(expr, Column):
-        return expr.name.lower()
-
-    if isinstance(expr, Function):
-        operands = ', '.join(get_expression_name(operand) for operand in expr.operands)
-        return f'{expr.fname.lower()}({operands})'
+    if isinstance(expr, (Function, LogicalOp)):
+        return expr.operands
+    if isinstance(expr, UnaryOp):
+        return (expr.operand,)
+    if isinstance(expr, BinaryOp):
+        return (expr.left, expr.right)
+    raise NotImplementedError
 
-    if isinstance(expr, Constant):
-        if isinstance(expr.value, str):
-            return repr(expr.value)
-        return str(expr.value)
 
-    if isinstance(expr, UnaryOp):
-        operand = get_expression_name(expr.operand)
-        return f'{type(expr).__name__.lower()}({operand})'
+def get_expression_name(expr):
+    """Come up with a reasonable identifier for an expression.
 
-    if isinstance(expr, BinaryOp):
-        operands = ', '.join(get_expression_name(operand) for operand in (expr.left, expr.right))
-        return f'{type(expr).__name__.lower()}({operands})'
+    The expression tree is walked iteratively, thus arbitrarily deep
+    expressions do not hit the interpreter recursion limit, and names
+    are computed only once for nodes appearing more than once.
 
-    raise NotImplementedError
+    Args:
+      expr: An expression node.
+    """
+    # Names of the visited nodes, keyed by node identity: expression
+    # nodes containing lists are not hashable.
+    names = {}
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        key = id(node)
+        if key in names:
+            continue
+
+        if isinstance(node, Column):
+            names[key] = node.name.lower()
+            continue
+
+        if isinstance(node, Constant):
+            names[key] = repr(node.value) if isinstance(node.value, str) else str(node.value)
+            continue
+
+        operands = _expression_operands(node)
+        if not visited:
+            # Name the operands first and come back to this node afterwards.
+            stack.append((node, True))
+            stack.extend((operand, False) for operand in reversed(operands))
+            continue
+
+        fname = node.fname.lower() if isinstance(node, Function) else node.node_name
+        operands = ', '.join(names[id(operand)] for operand in operands)
+        names[key] = f'{fname}({operands})'
+
+    return names[id(expr)]
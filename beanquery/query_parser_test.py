@@ -1,10 +1,21 @@
 __copyright__ = "Copyright (C) 2014-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import contextlib
 import datetime
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import threading
 import unittest
 
+from unittest import mock
+
 from decimal import Decimal as D
+import ply.yacc
+
 from beanquery import query_parser as qp
 
 
@@ -21,10 +32,23 @@ def Select(targets, from_clause=None, where_clause=None, **kwargs):
     return qp.Select(**defaults)
 
 
+# Do not write the parser tables built by the tests to the user cache.
+_MODULE_CONTEXT = contextlib.ExitStack()
+
+
+def setUpModule():
+    cachedir = _MODULE_CONTEXT.enter_context(tempfile.TemporaryDirectory())
+    _MODULE_CONTEXT.enter_context(mock.patch.dict(os.environ, {'XDG_CACHE_HOME': cachedir}))
+
+
+def tearDownModule():
+    _MODULE_CONTEXT.close()
+
+
 class QueryParserTestBase(unittest.TestCase):
 
     def setUp(self):
-        self.parser = qp.Parser()
+        self.parser = qp.Parser.get()
 
     def parse(self, query):
         return self.parser.parse(query.strip())
@@ -47,7 +71,7 @@ class QueryParserTestBase(unittest.TestCase):
 class TestLexer(unittest.TestCase):
 
     def setUp(self):
-        self.parser = qp.Parser()
+        self.parser = qp.Parser.get()
 
     def tokenize(self, string):
         return [(tok.type, tok.value) for tok in self.parser.tokenize(string)]
@@ -63,6 +87,18 @@ class TestLexer(unittest.TestCase):
         with self.assertRaises(qp.ParseError):
             self.tokenize(".foo")
 
+    def test_decimal(self):
+        for string, expected in [('4.2', '4.2'), ('4.20', '4.20'), ('4.', '4'),
+                                 ('.42', '0.42'), ('0.000', '0.000')]:
+            (_, value), = self.tokenize(string)
+            self.assertIsInstance(value, D)
+            self.assertEqual(str(value), expected)
+
+    def test_fuzzy_date(self):
+        # Missing fields are taken from the current date.
+        self.assertEqual(self.tokenize("#'May 28'"),
+                         [('DATE', datetime.date.today().replace(month=5, day=28))])
+
 class TestParseSelect(QueryParserTestBase):
 
     def test_select(self):
@@ -121,6 +157,8 @@ class TestParseSelect(QueryParserTestBase):
 
         # string
         self.assertParseTarget("SELECT 'rainy-day';", qp.Constant('rainy-day'))
+        self.assertParseTarget("SELECT 'NULL';", qp.Constant('NULL'))
+        self.assertParseTarget("SELECT 'TRUE';", qp.Constant('TRUE'))
 
         # date
         self.assertParseTarget("SELECT 1972-05-28;", qp.Constant(datetime.date(1972, 5, 28)))
@@ -134,6 +172,7 @@ class TestParseSelect(QueryParserTestBase):
         self.assertParseTarget("SELECT (1, 2);", qp.Constant([1, 2]))
         self.assertParseTarget("SELECT (1, 2, );", qp.Constant([1, 2]))
         self.assertParseTarget("SELECT ('x', 'y', 'z');", qp.Constant(['x', 'y', 'z']))
+        self.assertParseTarget("SELECT (NULL, TRUE, FALSE);", qp.Constant([None, True, False]))
 
         # column
         self.assertParseTarget("SELECT date;", qp.Column('date'))
@@ -153,8 +192,8 @@ class TestParseSelect(QueryParserTestBase):
         self.assertParseTarget("SELECT a IS NOT NULL;", qp.IsNotNull(qp.Column('a')))
 
         # bool expressions
-        self.assertParseTarget("SELECT a AND b;", qp.And(qp.Column('a'), qp.Column('b')))
-        self.assertParseTarget("SELECT a OR b;", qp.Or(qp.Column('a'), qp.Column('b')))
+        self.assertParseTarget("SELECT a AND b;", qp.And([qp.Column('a'), qp.Column('b')]))
+        self.assertParseTarget("SELECT a OR b;", qp.Or([qp.Column('a'), qp.Column('b')]))
         self.assertParseTarget("SELECT NOT a;", qp.Not(qp.Column('a')))
 
         # math expressions with identifiers
@@ -199,9 +238,9 @@ class TestParseSelect(QueryParserTestBase):
                 qp.Not(
                     qp.Equal(
                         qp.Column('b'),
-                        qp.And(
+                        qp.And([
                             qp.Constant(42),
-                            qp.Constant(17)))))))
+                            qp.Constant(17)]))))))
 
 
 class TestSelectPrecedence(QueryParserTestBase):
@@ -210,22 +249,32 @@ class TestSelectPrecedence(QueryParserTestBase):
 
         self.assertParseTarget(
             "SELECT a AND b OR c AND d;",
-            qp.Or(qp.And(qp.Column('a'), qp.Column('b')),
-                  qp.And(qp.Column('c'), qp.Column('d'))))
+            qp.Or([qp.And([qp.Column('a'), qp.Column('b')]),
+                   qp.And([qp.Column('c'), qp.Column('d')])]))
 
         self.assertParseTarget(
             "SELECT a = 2 AND b != 3;",
-            qp.And(qp.Equal(qp.Column('a'), qp.Constant(2)),
-                   qp.Not(qp.Equal(qp.Column('b'), qp.Constant(3)))))
+            qp.And([qp.Equal(qp.Column('a'), qp.Constant(2)),
+                    qp.Not(qp.Equal(qp.Column('b'), qp.Constant(3)))]))
 
         self.assertParseTarget(
             "SELECT not a AND b;",
-            qp.And(qp.Not(qp.Column('a')), qp.Column('b')))
+            qp.And([qp.Not(qp.Column('a')), qp.Column('b')]))
 
         self.assertParseTarget(
             "SELECT a + b AND c - d;",
-            qp.And(qp.Add(qp.Column('a'), qp.Column('b')),
-                   qp.Sub(qp.Column('c'), qp.Column('d'))))
+            qp.And([qp.Add(qp.Column('a'), qp.Column('b')),
+                    qp.Sub(qp.Column('c'), qp.Column('d'))]))
+
+        self.assertParseTarget(
+            "SELECT a AND b AND c OR d OR e;",
+            qp.Or([qp.And([qp.Column('a'), qp.Column('b'), qp.Column('c')]),
+                   qp.Column('d'),
+                   qp.Column('e')]))
+
+        self.assertParseTarget(
+            "SELECT a AND (b AND c);",
+            qp.And([qp.Column('a'), qp.And([qp.Column('b'), qp.Column('c')])]))
 
         self.assertParseTarget(
             "SELECT a * b + c / d - 3;",
@@ -240,19 +289,19 @@ class TestSelectPrecedence(QueryParserTestBase):
 
         self.assertParseTarget(
             "SELECT 'orange' IN tags AND 'bananas' IN tags;",
-            qp.And(
+            qp.And([
                 qp.Contains(
                     qp.Constant('orange'),
                     qp.Column('tags')),
                 qp.Contains(
                     qp.Constant('bananas'),
-                    qp.Column('tags'))))
+                    qp.Column('tags'))]))
 
 
 class TestSelectFrom(QueryParserTestBase):
 
     def test_select_from(self):
-        expr = qp.Equal(qp.Column('d'), qp.And(qp.Function('max', [qp.Column('e')]), qp.Constant(17)))
+        expr = qp.Equal(qp.Column('d'), qp.And([qp.Function('max', [qp.Column('e')]), qp.Constant(17)]))
 
         with self.assertRaises(qp.ParseError):
             self.parse("SELECT a, b FROM;")
@@ -301,7 +350,7 @@ class TestSelectFrom(QueryParserTestBase):
 class TestSelectWhere(QueryParserTestBase):
 
     def test_where(self):
-        expr = qp.Equal(qp.Column('d'), qp.And(qp.Function('max', [qp.Column('e')]), qp.Constant(17)))
+        expr = qp.Equal(qp.Column('d'), qp.And([qp.Function('max', [qp.Column('e')]), qp.Constant(17)]))
         self.assertParse(
             "SELECT a, b WHERE d = (max(e) and 17);",
             Select([
@@ -316,7 +365,7 @@ class TestSelectWhere(QueryParserTestBase):
 class TestSelectFromAndWhere(QueryParserTestBase):
 
     def test_from_and_where(self):
-        expr = qp.Equal(qp.Column('d'), qp.And(qp.Function('max', [qp.Column('e')]), qp.Constant(17)))
+        expr = qp.Equal(qp.Column('d'), qp.And([qp.Function('max', [qp.Column('e')]), qp.Constant(17)]))
         self.assertParse(
             "SELECT a, b FROM d = (max(e) and 17) WHERE d = (max(e) and 17);",
             Select([
@@ -611,6 +660,223 @@ class TestComments(QueryParserTestBase):
                 qp.Target(qp.Column('second'), None),
             ]))
 
+        self.assertParse(
+            """SELECT first, /*** comment ***/ second;""",
+            Select([
+                qp.Target(qp.Column('first'), None),
+                qp.Target(qp.Column('second'), None),
+            ]))
+
+    def test_comments_pathological(self):
+        # These used to trigger catastrophic backtracking in the regular
+        # expression matching comments.
+        with self.assertRaises(qp.ParseError):
+            self.parse("SELECT first, /*" + "\n" * 100 + "*")
+        with self.assertRaises(qp.ParseError):
+            self.parse("SELECT first, /*" + "*" * 10000 + "x")
+        self.assertParse(
+            "SELECT first, /*" + "*\n" * 10000 + "*/ second;",
+            Select([
+                qp.Target(qp.Column('first'), None),
+                qp.Target(qp.Column('second'), None),
+            ]))
+
+
+def _fixed_date(today):
+    """Return a datetime.date subclass for which today() returns 'today'."""
+    class FixedDate(datetime.date):
+        @classmethod
+        def today(cls):
+            return today
+    return FixedDate
+
+
+class TestParseCache(QueryParserTestBase):
+
+    def test_cached(self):
+        query = "SELECT date FROM CLOSE;"
+        statement = self.parse(query)
+        self.assertIs(self.parse(query), statement)
+
+    def test_default_close_date(self):
+        query = "SELECT date FROM year = 2014;"
+        statement = self.parser.parse(query, default_close_date=datetime.date(2014, 1, 1))
+        self.assertEqual(statement.from_clause.close, datetime.date(2014, 1, 1))
+        statement = self.parser.parse(query, default_close_date=datetime.date(2015, 1, 1))
+        self.assertEqual(statement.from_clause.close, datetime.date(2015, 1, 1))
+
+    def test_fuzzy_date(self):
+        # Missing date fields are taken from the current date, also when
+        # the statement is parsed again after the date changed.
+        query = "SELECT date WHERE date = #'May 28';"
+        for today in datetime.date(2001, 1, 1), datetime.date(2002, 1, 1):
+            with mock.patch('datetime.date', _fixed_date(today)):
+                statement = qp.Parser.get().parse(query)
+            self.assertEqual(statement.where_clause.right,
+                             qp.Constant(today.replace(month=5, day=28)))
+
+    def test_error_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(qp.ParseError):
+                self.parse("SELECT ; ")
+
+    def test_debug_not_cached(self):
+        # The shell parses with debugging enabled to trace the parser.
+        query = "SELECT date FROM CLOSE;"
+        with contextlib.redirect_stderr(io.StringIO()):
+            statement = self.parser.parse(query, True)
+            self.assertIsNot(self.parser.parse(query, True), statement)
+        self.assertEqual(statement, self.parse(query))
+        self.assertIsNot(statement, self.parse(query))
+
+
+class TestSharedParser(unittest.TestCase):
+
+    def test_get(self):
+        self.assertIs(qp.Parser.get(), qp.Parser.get())
+        self.assertIsInstance(qp.Parser.get(), qp.Parser)
+        self.assertIsInstance(qp.SelectParser.get(), qp.SelectParser)
+        self.assertIsNot(qp.SelectParser.get(), qp.Parser.get())
+
+    def test_threads(self):
+        parser = qp.Parser.get()
+        query = "SELECT date FROM year = {};"
+        results = {}
+        def parse(year):
+            date = datetime.date(year, 1, 1)
+            statement = parser.parse(query.format(year), default_close_date=date)
+            results[year] = statement.from_clause.close
+        threads = [threading.Thread(target=parse, args=(year,))
+                   for year in range(2000, 2010)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {year: datetime.date(year, 1, 1)
+                                   for year in range(2000, 2010)})
+
+    def test_get_race(self):
+        class RaceParser(qp.Parser):
+            pass
+        parser = RaceParser()
+        class Lock:
+            # Emulate another thread creating the shared instance
+            # while this one is waiting to acquire the lock.
+            def __enter__(self):
+                RaceParser._instance = parser
+            def __exit__(self, *exc_info):
+                pass
+        with mock.patch.object(RaceParser, '_lock', Lock()):
+            self.assertIs(RaceParser.get(), parser)
+
+    def test_tables(self):
+        # The lexer and parser tables are built once per class.
+        self.assertIs(qp.Parser().parser, qp.Parser().parser)
+        self.assertIsNot(qp.SelectParser().parser, qp.Parser().parser)
+        date = datetime.date(2014, 1, 1)
+        statement = qp.Parser().parse("SELECT date FROM year = 2014;", default_close_date=date)
+        self.assertEqual(statement.from_clause.close, date)
+
+    def test_tables_options(self):
+        # Parsers built with explicit options get private tables.
+        parser = qp.Parser(errorlog=ply.yacc.NullLogger())
+        self.assertIsNot(parser.parser, qp.Parser.get().parser)
+        self.assertIsNot(parser.lexer, qp.Parser.get().lexer)
+        self.assertEqual(parser.parse("SELECT a;"), qp.Parser.get().parse("SELECT a;"))
+
+
+class TestTablesCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.cachedir = os.path.join(self.tmpdir, 'beanquery')
+        self.filename = os.path.join(self.cachedir, 'Parser.pickle')
+
+    def environ(self, path):
+        return mock.patch.dict(os.environ, {'XDG_CACHE_HOME': path})
+
+    def build(self):
+        # Parser options force building private tables, not to reuse
+        # the ones already built for the class.
+        return qp.Parser(errorlog=ply.yacc.NullLogger())
+
+    def test_cache(self):
+        with self.environ(self.tmpdir):
+            parser = self.build()
+            # The temporary file is moved in place.
+            self.assertEqual(os.listdir(self.cachedir), ['Parser.pickle'])
+            with mock.patch('ply.yacc.LRGeneratedTable') as generate:
+                cached = self.build()
+            generate.assert_not_called()
+            self.assertEqual(os.listdir(self.cachedir), ['Parser.pickle'])
+        self.assertEqual(cached.parser.action, parser.parser.action)
+        self.assertIsInstance(cached.parse("SELECT a;"), qp.Select)
+
+    def test_not_a_directory(self):
+        filename = os.path.join(self.tmpdir, 'file')
+        with open(filename, 'wb'):
+            pass
+        with self.environ(filename):
+            parser = self.build()
+        self.assertIsInstance(parser.parse("SELECT a;"), qp.Select)
+
+    def test_not_writable(self):
+        os.mkdir(self.cachedir, 0o555)
+        self.addCleanup(os.chmod, self.cachedir, 0o755)
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(self.environ(self.tmpdir))
+            if os.access(self.cachedir, os.W_OK):
+                # Permissions do not apply to the superuser.
+                stack.enter_context(mock.patch('os.access', return_value=False))
+            parser = self.build()
+        self.assertIsInstance(parser.parse("SELECT a;"), qp.Select)
+        self.assertEqual(os.listdir(self.cachedir), [])
+
+    def test_write_error(self):
+        with self.environ(self.tmpdir):
+            with mock.patch('os.replace', side_effect=OSError):
+                parser = self.build()
+        self.assertIsInstance(parser.parse("SELECT a;"), qp.Select)
+        # The temporary file is removed.
+        self.assertEqual(os.listdir(self.cachedir), [])
+
+    def test_corrupted(self):
+        with self.environ(self.tmpdir):
+            self.build()
+            with open(self.filename, 'rb') as infile:
+                data = infile.read()
+            with open(self.filename, 'wb') as outfile:
+                outfile.write(data[:len(data) // 2])
+            parser = self.build()
+            with open(self.filename, 'rb') as infile:
+                self.assertEqual(infile.read(), data)
+        self.assertIsInstance(parser.parse("SELECT a;"), qp.Select)
+
+    def test_signature(self):
+        with self.environ(self.tmpdir):
+            self.build()
+            with open(self.filename, 'rb') as infile:
+                tables = pickle.load(infile)
+            with open(self.filename, 'wb') as outfile:
+                pickle.dump(dict(tables, _lr_signature='stale'), outfile)
+            parser = self.build()
+            with open(self.filename, 'rb') as infile:
+                self.assertEqual(pickle.load(infile), tables)
+        self.assertIsInstance(parser.parse("SELECT a;"), qp.Select)
+
+    def test_ply_format(self):
+        # The tables cached by PLY, as done by previous versions, are a
+        # sequence of pickles starting with the tables format version.
+        os.mkdir(self.cachedir)
+        with open(self.filename, 'wb') as outfile:
+            pickle.dump(ply.yacc.__tabversion__, outfile)
+        with self.environ(self.tmpdir):
+            parser = self.build()
+            with open(self.filename, 'rb') as infile:
+                self.assertIsInstance(pickle.load(infile), dict)
+        self.assertIsInstance(parser.parse("SELECT a;"), qp.Select)
+
 
 class TestExpressionName(QueryParserTestBase):
 
@@ -635,14 +901,63 @@ class TestExpressionName(QueryParserTestBase):
         self.assertEqual(name, 'not(account)')
 
     def test_binary(self):
-        name = qp.get_expression_name(qp.And(qp.Column('a'), qp.Column('b')))
-        self.assertEqual(name, 'and(a, b)')
+        name = qp.get_expression_name(qp.Equal(qp.Column('a'), qp.Column('b')))
+        self.assertEqual(name, 'equal(a, b)')
+
+    def test_logical(self):
+        name = qp.get_expression_name(qp.And([qp.Column('a'), qp.Column('b'), qp.Column('c')]))
+        self.assertEqual(name, 'and(a, b, c)')
+
+    def test_shared(self):
+        column = qp.Column('a')
+        name = qp.get_expression_name(qp.Function('max', [column, qp.Neg(column), column]))
+        self.assertEqual(name, 'max(a, neg(a), a)')
+
+    def test_deep(self):
+        expr = qp.Column('a')
+        for _ in range(10000):
+            expr = qp.Not(expr)
+        name = qp.get_expression_name(expr)
+        self.assertEqual(name, 'not(' * 10000 + 'a' + ')' * 10000)
 
     def test_unknown(self):
         with self.assertRaises(RuntimeError):
             name = qp.get_expression_name(None)
 
 
+class TestNode(unittest.TestCase):
+
+    def test_eq(self):
+        self.assertEqual(qp.Column('a'), qp.Column('a'))
+        self.assertNotEqual(qp.Column('a'), qp.Column('b'))
+        self.assertNotEqual(qp.Not(qp.Column('a')), qp.Neg(qp.Column('a')))
+        self.assertNotEqual(qp.Column('a'), ('a',))
+
+    def test_hash(self):
+        self.assertEqual(hash(qp.Not(qp.Column('a'))), hash(qp.Not(qp.Column('a'))))
+        with self.assertRaises(TypeError):
+            hash(qp.Function('max', [qp.Column('a')]))
+
+    def test_repr(self):
+        self.assertEqual(repr(qp.Add(qp.Column('a'), qp.Constant(1))),
+                         "Add(left=Column(name='a'), right=Constant(value=1))")
+
+    def test_slots(self):
+        node = qp.Not(qp.Column('a'))
+        with self.assertRaises(AttributeError):
+            setattr(node, 'bogus', 1)
+
+
+class TestLogicalOp(unittest.TestCase):
+
+    def test_left_right(self):
+        a, b, c = qp.Column('a'), qp.Column('b'), qp.Column('c')
+        expr = qp.And([a, b])
+        self.assertEqual((expr.left, expr.right), (a, b))
+        expr = qp.Or([a, b, c])
+        self.assertEqual((expr.left, expr.right), (qp.Or([a, b]), c))
+
+
 class TestRepr(unittest.TestCase):
     # 100% branch test coverage is hard...
 